@@ -15,6 +15,47 @@ __author__ = 'Brett Dixon'
 __license__ = 'MIT'
 __copyright__ = 'Copyright 2015 Brett Dixon'
 
-from .models import Connection, Revision, Changelist, ConnectionStatus, ErrorLevel, Client, Stream
-from .api import connect, edit, sync, info, changelist, open
+import sys
+import importlib
+
+#: Public names and the submodule they are loaded from on first access
+_LAZY = {
+    'Connection': 'models',
+    'Revision': 'models',
+    'Changelist': 'models',
+    'ConnectionStatus': 'models',
+    'ErrorLevel': 'models',
+    'Client': 'models',
+    'Stream': 'models',
+    'connect': 'api',
+    'edit': 'api',
+    'delete': 'api',
+    'sync': 'api',
+    'info': 'api',
+    'changelist': 'api',
+    'open': 'api',
+}
+
+__all__ = sorted(_LAZY)
+
+
+def __getattr__(name):
+    # -- Only called for names that are not loaded yet, importing the models is deferred until one is used
+    if name not in _LAZY:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+    module = importlib.import_module('.' + _LAZY[name], __name__)
+    value = globals()[name] = getattr(module, name)
+
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
+
+if sys.version_info < (3, 7):
+    # -- Module __getattr__ is not supported, load everything up front
+    from .models import Connection, Revision, Changelist, ConnectionStatus, ErrorLevel, Client, Stream
+    from .api import connect, edit, delete, sync, info, changelist, open
 
@@ -10,7 +10,8 @@ This module implements the Perforce API
 :license: MIT, see LICENSE for more details
 """
 
-from .models import Connection
+from .models import Connection, Changelist, Revision, match_records, log_errors, change_args
+from . import errors
 
 
 __CONNECTION = None
@@ -25,29 +26,82 @@ def connect(*args, **kwargs):
     return __CONNECTION
 
 
-def edit(filename, connection=None):
+def edit(filename, connection=None, changelist=None):
     """Checks out a file into the default changelist
 
-    :param filename: File to check out
+    A list of files is checked out with a single ``edit`` and returned from a single ``fstat``
+
+    :param filename: File to check out, or a list of files
     :type filename: str
     :param connection: Connection object to use
     :type connection: :py:class:`Connection`
+    :param changelist: Optional changelist to checkout the file into
+    :type changelist: :class:`.Changelist`
+    :returns: list<:class:`.Revision`> when given a list
     """
     c = connection or connect()
+    if isinstance(filename, (tuple, list)):
+        return _open(c, filename, changelist, add=False)
+
     rev = c.ls(filename)
     if rev:
-        rev[0].edit()
+        rev[0].edit(changelist if changelist is not None else 0)
+
+
+def delete(filename, connection=None, changelist=None):
+    """Marks a file for delete
+
+    A list of files is marked with a single ``delete`` and returned from a single ``fstat``
+
+    :param filename: File to delete, or a list of files
+    :type filename: str
+    :param connection: Connection object to use
+    :type connection: :py:class:`Connection`
+    :param changelist: Optional changelist to open the files into
+    :type changelist: :class:`.Changelist`
+    :returns: list<:class:`.Revision`> when given a list
+    """
+    c = connection or connect()
+    if not isinstance(filename, (tuple, list)):
+        rev = c.ls(filename)
+        if rev:
+            rev[0].delete(changelist if changelist is not None else 0)
+        return
+
+    if not filename:
+        return []
+
+    try:
+        log_errors(c.runArgs(['delete'] + change_args(changelist), filename, partial=True), 'Unable to delete: {}')
+        results = c.runArgs(['fstat'], filename, partial=True).records
+    except errors.CommandError as err:
+        raise errors.RevisionError(err.args[0])
+
+    if isinstance(changelist, Changelist):
+        # -- Files will be queried again when needed
+        changelist._files = None
+
+    return [Revision(r, c) for r in results if r.get('action') == 'delete']
 
 
 def sync(filename, connection=None):
     """Syncs a file
 
-    :param filename: File to check out
+    A list of files is synced with a single ``sync`` and returned from a single ``fstat``
+
+    :param filename: File to check out, or a list of files
     :type filename: str
     :param connection: Connection object to use
     :type connection: :py:class:`Connection`
+    :returns: list<:class:`.Revision`> when given a list
     """
     c = connection or connect()
+    if isinstance(filename, (tuple, list)):
+        if not filename:
+            return []
+        log_errors(c.runArgs(['sync', '-s'], filename, partial=True), 'Unable to sync: {}')
+        return [Revision(r, c) for r in c.runArgs(['fstat'], filename, partial=True).records]
+
     rev = c.ls(filename)
     if rev:
         rev[0].sync()
@@ -61,7 +115,7 @@ def info(connection=None):
     :returns: dict
     """
     c = connection or connect()
-    return c.run(['info'])[0]
+    return c.runCached(['info'])[0]
 
 
 def changelist(description=None, connection=None):
@@ -78,17 +132,86 @@ def changelist(description=None, connection=None):
     return c.findChangelist(description)
 
 
-def open(filename, connection=None):
+def open(filename, connection=None, changelist=None):
     """Edits or Adds a filename ensuring the file is in perforce and editable
 
-    :param filename: File to check out
+    A list of files is classified with a single ``fstat``, then opened with at most one ``edit``, one ``reopen``
+    and one ``add`` and returned from a single ``fstat``
+
+    :param filename: File to check out, or a list of files
     :type filename: str
     :param connection: Connection object to use
     :type connection: :py:class:`Connection`
+    :param changelist: Optional changelist to open the files into
+    :type changelist: :class:`.Changelist`
+    :returns: list<:class:`.Revision`> when given a list
     """
     c = connection or connect()
+    if isinstance(filename, (tuple, list)):
+        return _open(c, filename, changelist)
+
     res = c.ls(filename)
     if res and res[0].revision:
-        res[0].edit()
+        res[0].edit(changelist if changelist is not None else 0)
     else:
-        c.add(filename)
+        c.add(filename, changelist)
+
+
+def _open(connection, files, changelist=None, add=True):
+    """Opens many files for edit, or add when they are not in the depot, with one process per step
+
+    :param connection: Connection object to use
+    :type connection: :py:class:`Connection`
+    :param files: Files to open
+    :type files: list
+    :param changelist: Optional changelist to open the files into
+    :type changelist: :class:`.Changelist`
+    :param add: Add files that are not in the depot
+    :type add: bool
+    :returns: list<:class:`.Revision`>
+    """
+    files = [f for f in files if connection.inView(f)]
+    if not files:
+        return []
+
+    cmd = change_args(changelist)
+
+    try:
+        records = match_records(files, connection.runArgs(['fstat'], files, partial=True).records)
+
+        toedit, toreopen, toadd = [], [], []
+        for f in files:
+            record = records.get(f)
+            if record is None or (not record.get('action') and
+                                  record.get('headAction') in ('delete', 'move/delete')):
+                toadd.append(f)
+            elif record.get('action'):
+                toreopen.append(f)
+            else:
+                toedit.append(f)
+
+        if toedit:
+            log_errors(connection.runArgs(['edit'] + cmd, toedit, partial=True), 'Unable to edit: {}')
+        if toreopen and changelist is not None:
+            log_errors(connection.runArgs(['reopen'] + cmd, toreopen, partial=True), 'Unable to reopen: {}')
+
+        opened = toedit + toreopen
+        if add and toadd:
+            verdicts = connection.canAdd(toadd)
+            toadd = [f for f in toadd if verdicts[f]]
+            if toadd:
+                log_errors(connection.runArgs(['add'] + cmd, toadd, partial=True), 'Unable to add: {}')
+                opened += toadd
+
+        if not opened:
+            return []
+
+        results = connection.runArgs(['fstat'], opened, partial=True).records
+    except errors.CommandError as err:
+        raise errors.RevisionError(err.args[0])
+
+    if isinstance(changelist, Changelist):
+        # -- Files will be queried again when needed
+        changelist._files = None
+
+    return [Revision(r, connection) for r in results]
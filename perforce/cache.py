@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+"""
+perforce.cache
+~~~~~~~~~~~~~~
+
+This module implements an on-disk cache of file revision contents shared between processes on the same host
+
+:copyright: (c) 2015 by Brett Dixon
+:license: MIT, see LICENSE for more details
+"""
+
+import os
+import io
+import mmap
+import errno
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+import six
+
+
+LOGGER = logging.getLogger(__name__)
+#: Default maximum size of a cache in bytes
+MAX_SIZE = 2 * 1024 * 1024 * 1024
+#: Fraction of the maximum size to prune down to when the cache is full
+PRUNE_RATIO = 0.8
+#: Base file types whose printed content always matches the server digest
+DIGEST_TYPES = ('text', 'xtext', 'ctext', 'cxtext', 'ltext', 'binary', 'xbinary', 'ubinary', 'uxbinary', 'apple',
+                'resource')
+
+
+def key(record, port=''):
+    """Gets the cache key for a revision record from ``fstat`` or ``files``
+
+    Revisions are keyed by their content digest when the printed content is guaranteed to match it, otherwise by
+    server, depot path and revision.  Records that do not describe a specific revision have no key.
+
+    :param record: Revision record
+    :type record: dict
+    :param port: Server the record came from
+    :type port: str
+    :returns: str or None
+    """
+    rev = record.get('headRev') or record.get('rev')
+    if not rev:
+        return None
+
+    filetype = record.get('headType') or record.get('type') or ''
+    base, _, modifiers = filetype.partition('+')
+    if record.get('digest') and base in DIGEST_TYPES and 'k' not in modifiers:
+        return record['digest'].lower()
+
+    spec = u'{}\0{}#{}'.format(port, record['depotFile'], rev)
+
+    return hashlib.sha1(spec.encode('utf8')).hexdigest()
+
+
+class RevisionCache(object):
+    """A content addressed store of file revisions on local disk
+
+    Entries are written to a temporary file and renamed into place so readers never see partial content and any
+    number of processes can share the same root.  Every hit updates the modified time of the entry and the least
+    recently used entries are removed once the cache grows past ``maxsize``.
+
+    :param root: Directory to store entries in
+    :type root: str
+    :param maxsize: Maximum size of the cache in bytes
+    :type maxsize: int
+    """
+    def __init__(self, root, maxsize=MAX_SIZE):
+        self._root = os.path.abspath(str(root))
+        self._maxsize = maxsize
+        self._size = None
+        self._lock = threading.Lock()
+
+        for dirname in (self._root, os.path.join(self._root, 'tmp')):
+            try:
+                os.makedirs(dirname)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+
+    def __repr__(self):
+        return '<{}: {}>'.format(self.__class__.__name__, self._root)
+
+    def __contains__(self, name):
+        return name is not None and os.path.isfile(self.path(name))
+
+    @property
+    def root(self):
+        """Directory entries are stored in"""
+        return self._root
+
+    @property
+    def maxsize(self):
+        """Maximum size of the cache in bytes"""
+        return self._maxsize
+
+    @property
+    def size(self):
+        """Total size of all entries in bytes"""
+        return sum(s.st_size for _, s in self._entries())
+
+    def path(self, name):
+        """Local path of an entry
+
+        :param name: Cache key
+        :type name: str
+        :returns: str
+        """
+        return os.path.join(self._root, name[:2], name)
+
+    def open(self, name):
+        """Opens an entry for reading
+
+        :param name: Cache key
+        :type name: str
+        :returns: :class:`io.BufferedReader` or None if the entry is not cached
+        """
+        if name is None:
+            return None
+
+        filename = self.path(name)
+        try:
+            fh = io.open(filename, 'rb')
+        except (IOError, OSError):
+            return None
+
+        self._touch(filename)
+
+        return fh
+
+    def map(self, name):
+        """Memory maps an entry, empty entries are returned as an empty bytes object
+
+        :param name: Cache key
+        :type name: str
+        :returns: :class:`mmap.mmap` or None if the entry is not cached
+        """
+        fh = self.open(name)
+        if fh is None:
+            return None
+
+        with fh:
+            if not os.fstat(fh.fileno()).st_size:
+                return b''
+
+            return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def put(self, name, source):
+        """Stores the contents of a file object or local file as an entry
+
+        :param name: Cache key
+        :type name: str
+        :param source: File object or path to read from
+        :type source: file or str
+        :returns: str -- Local path of the entry
+        """
+        filename = self.path(name)
+        try:
+            os.makedirs(os.path.dirname(filename))
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+
+        fd, temp = tempfile.mkstemp(dir=os.path.join(self._root, 'tmp'))
+        try:
+            with io.open(fd, 'wb') as fh:
+                if hasattr(source, 'read'):
+                    shutil.copyfileobj(source, fh)
+                else:
+                    with io.open(str(source), 'rb') as src:
+                        shutil.copyfileobj(src, fh)
+                size = fh.tell()
+            self._rename(temp, filename)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = self.size
+            else:
+                self._size += size
+            full = self._size > self._maxsize
+
+        if full:
+            self.prune()
+
+        return filename
+
+    def prune(self, maxsize=None):
+        """Removes the least recently used entries until the cache is below a fraction of its maximum size
+
+        :param maxsize: Size to prune to, defaults to a fraction of :attr:`maxsize`
+        :type maxsize: int
+        :returns: int -- Number of entries removed
+        """
+        maxsize = int(self._maxsize * PRUNE_RATIO) if maxsize is None else maxsize
+        entries = sorted(self._entries(), key=lambda e: e[1].st_mtime)
+        size = sum(s.st_size for _, s in entries)
+
+        removed = 0
+        for filename, filestat in entries:
+            if size <= maxsize:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                # -- Removed by another process or still open on windows
+                continue
+            size -= filestat.st_size
+            removed += 1
+
+        with self._lock:
+            self._size = size
+
+        LOGGER.debug('Pruned {} entries from {}'.format(removed, self._root))
+
+        return removed
+
+    def clear(self):
+        """Removes all entries"""
+        self.prune(0)
+
+    def _entries(self):
+        """Yields the path and stat of every entry"""
+        for dirname in os.listdir(self._root):
+            if dirname == 'tmp' or not os.path.isdir(os.path.join(self._root, dirname)):
+                continue
+            for name in os.listdir(os.path.join(self._root, dirname)):
+                filename = os.path.join(self._root, dirname, name)
+                try:
+                    yield filename, os.stat(filename)
+                except OSError:
+                    continue
+
+    @staticmethod
+    def _touch(filename):
+        """Marks an entry as recently used"""
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _rename(src, dst):
+        """Atomically moves a file into place, an existing entry with the same key is left alone"""
+        if six.PY3:
+            os.replace(src, dst)
+            return
+
+        try:
+            os.rename(src, dst)
+        except OSError:
+            # -- Windows will not rename over an existing file, which already holds the same contents
+            if not os.path.isfile(dst):
+                raise
+            os.remove(src)
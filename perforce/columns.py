@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+"""
+perforce.columns
+~~~~~~~~~~~~~~~~
+
+This module implements column storage for large fstat results, see :meth:`.Connection.lsColumns`
+
+:copyright: (c) 2015 by Brett Dixon
+:license: MIT, see LICENSE for more details
+"""
+
+import array
+
+import six
+
+
+#: Fields stored as integers, missing values are -1
+INT_FIELDS = ('headRev', 'headChange', 'headTime', 'headModTime', 'haveRev', 'fileSize', 'change', 'rev', 'time',
+              'workRev', 'otherOpen')
+#: Integer fields that hold seconds since the epoch
+TIME_FIELDS = ('headTime', 'headModTime', 'time')
+#: String fields with mostly unique values, stored as one buffer and offsets instead of a dictionary
+PATH_FIELDS = ('depotFile', 'clientFile', 'movedFile', 'path', 'digest')
+#: Fields loaded when none are given
+DEFAULT_FIELDS = ('depotFile', 'headRev', 'headChange', 'headAction', 'headType', 'headTime', 'fileSize')
+
+try:
+    array.array('q')
+    INT_TYPECODE = 'q'
+except ValueError:
+    INT_TYPECODE = 'l'
+
+
+def _text(value):
+    """Decodes a raw marshal value"""
+    if isinstance(value, bytes):
+        return value.decode('utf8', 'ignore')
+
+    return six.text_type(value)
+
+
+class DictionaryColumn(object):
+    """A string column stored as integer codes into a list of unique values, missing values have the code -1"""
+    def __init__(self):
+        self.codes = array.array('i')
+        self.categories = []
+        self._index = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        code = self.codes[index]
+
+        return None if code < 0 else self.categories[code]
+
+    def __iter__(self):
+        for code in self.codes:
+            yield None if code < 0 else self.categories[code]
+
+    def append(self, value):
+        """Adds a raw value
+
+        :param value: Raw value or None
+        :type value: bytes
+        """
+        if value is None:
+            self.codes.append(-1)
+            return
+
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.categories)
+            self.categories.append(_text(value))
+        self.codes.append(code)
+
+    def counts(self):
+        """Number of rows for each value
+
+        :returns: dict
+        """
+        totals = [0] * len(self.categories)
+        for code in self.codes:
+            if code >= 0:
+                totals[code] += 1
+
+        return dict(zip(self.categories, totals))
+
+
+class StringColumn(object):
+    """A string column stored as a single utf8 buffer and the end offset of each value, missing values are empty"""
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array.array(INT_TYPECODE)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        index = index + len(self) if index < 0 else index
+        start = self.offsets[index - 1] if index else 0
+
+        return self.data[start:self.offsets[index]].decode('utf8')
+
+    def __iter__(self):
+        start = 0
+        for end in self.offsets:
+            yield self.data[start:end].decode('utf8')
+            start = end
+
+    def append(self, value):
+        """Adds a raw value
+
+        :param value: Raw value or None
+        :type value: bytes
+        """
+        if value is not None:
+            self.data += value if isinstance(value, bytes) else six.text_type(value).encode('utf8')
+        self.offsets.append(len(self.data))
+
+
+class Columns(object):
+    """Column storage for fstat records, integer fields are arrays, paths are :class:`StringColumn` and other
+    strings are :class:`DictionaryColumn`
+
+    :param fields: Field names to store
+    :type fields: list
+    """
+    def __init__(self, fields=DEFAULT_FIELDS):
+        self._fields = tuple(fields)
+        self._columns = {}
+        for field in self._fields:
+            if field in INT_FIELDS:
+                self._columns[field] = array.array(INT_TYPECODE)
+            elif field in PATH_FIELDS:
+                self._columns[field] = StringColumn()
+            else:
+                self._columns[field] = DictionaryColumn()
+        self._keys = [(f, f.encode('ascii') if six.PY3 else f) for f in self._fields]
+        self._rows = 0
+
+    def __repr__(self):
+        return '<{}: {} rows, {}>'.format(self.__class__.__name__, self._rows, ', '.join(self._fields))
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, field):
+        return self._columns[field]
+
+    def __contains__(self, field):
+        return field in self._columns
+
+    @property
+    def fields(self):
+        """Names of the stored fields"""
+        return self._fields
+
+    def append(self, record):
+        """Adds a raw fstat record read with byte keys
+
+        :param record: Undecoded record
+        :type record: dict
+        """
+        for field, key in self._keys:
+            value = record.get(key)
+            column = self._columns[field]
+            if field in INT_FIELDS:
+                try:
+                    column.append(int(value) if value is not None else -1)
+                except ValueError:
+                    column.append(-1)
+            else:
+                column.append(value)
+        self._rows += 1
+
+    def row(self, index):
+        """Gets a single row as a dict
+
+        :param index: Row number
+        :type index: int
+        :returns: dict
+        """
+        return dict((field, self._columns[field][index]) for field in self._fields)
+
+    def numpy(self):
+        """Gets the columns as NumPy arrays.  Integers are int64 and dictionary columns are their int32 codes, both
+        sharing memory with the stored arrays, times are converted to datetime64 seconds with NaT for missing values
+        and string columns are left as they are.
+
+        :raises: ImportError when NumPy is not installed
+        :returns: dict
+        """
+        # -- NumPy is optional and slow to import, so it is only imported here
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('NumPy is required for numpy columns')
+
+        dtype = numpy.dtype(INT_TYPECODE)
+        arrays = {}
+        for field, column in six.iteritems(self._columns):
+            if isinstance(column, DictionaryColumn):
+                arrays[field] = numpy.frombuffer(column.codes, dtype=numpy.int32) if len(column) else \
+                    numpy.zeros(0, numpy.int32)
+            elif isinstance(column, StringColumn):
+                arrays[field] = column
+            else:
+                values = numpy.frombuffer(column, dtype=dtype) if len(column) else numpy.zeros(0, dtype)
+                if field in TIME_FIELDS:
+                    missing = values < 0
+                    values = values.astype('datetime64[s]')
+                    values[missing] = numpy.datetime64('NaT')
+                arrays[field] = values
+
+        return arrays
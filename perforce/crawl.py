@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+"""
+perforce.crawl
+~~~~~~~~~~~~~~
+
+This module implements a crawler that splits a large depot tree into shards and lists them concurrently
+
+:copyright: (c) 2015 by Brett Dixon
+:license: MIT, see LICENSE for more details
+"""
+
+import os
+import io
+import json
+import logging
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from .api import connect
+from .models import log_errors
+
+
+LOGGER = logging.getLogger(__name__)
+#: Target number of files in each shard
+SHARD_SIZE = 50000
+#: Commands a crawler can run on each shard
+COMMANDS = ('fstat', 'files')
+
+
+class Crawler(object):
+    """Lists every file under a depot path by splitting the tree into shards of roughly ``shardsize`` files and
+    running ``fstat`` or ``files`` on a pool of concurrent processes
+
+    The tree is sized level by level with a batched ``sizes -s`` and split with a batched ``dirs``, directories
+    that are still too large are split further and small neighbours are packed together.  Records are yielded in
+    shard order, which is the same for every run of the same tree.  With a ``checkpoint`` file the shards and the
+    number of shards consumed are saved as the crawl goes, an interrupted crawl started again with the same file
+    resumes from the first shard that was not fully consumed.  The checkpoint is removed once the crawl finishes.
+
+    ::
+
+        >>> for record in Crawler('//depot', workers=8, checkpoint='/tmp/depot.json'):
+        ...     index(record)
+
+    :param root: Depot directory to crawl, such as ``//depot``
+    :type root: str
+    :param connection: Connection object to use
+    :type connection: :py:class:`Connection`
+    :param command: Command to run on each shard, fstat or files
+    :type command: str
+    :param args: Extra arguments for the command, such as ``['-Ol']``
+    :type args: list
+    :param shardsize: Target number of files in each shard
+    :type shardsize: int
+    :param workers: Number of commands to run at the same time
+    :type workers: int
+    :param checkpoint: Optional path of a file to save progress to
+    :type checkpoint: str
+    """
+    def __init__(self, root, connection=None, command='fstat', args=None, shardsize=SHARD_SIZE, workers=4,
+                 checkpoint=None):
+        if command not in COMMANDS:
+            raise ValueError('Unsupported command: {}'.format(command))
+
+        self._connection = connection or connect()
+        self._root = six.text_type(root).rstrip('/').rstrip('.').rstrip('/')
+        self._command = [command] + list(args or [])
+        self._shardsize = shardsize
+        self._workers = workers
+        self._checkpoint = checkpoint
+        self._shards = None
+        self._done = 0
+
+    def __repr__(self):
+        return '<{}: {}>'.format(self.__class__.__name__, self._root)
+
+    def __iter__(self):
+        for index, records in self.iterShards():
+            for record in records:
+                yield record
+
+    @property
+    def shards(self):
+        """List of shards, each a list of filespecs"""
+        if self._shards is None:
+            self._load()
+
+        return self._shards
+
+    @property
+    def done(self):
+        """Number of shards fully consumed"""
+        return self._done
+
+    def iterShards(self):
+        """Yields the index and records of each shard that has not been consumed, in order.  A shard counts as
+        consumed when the next one is requested.
+
+        :returns: generator<tuple(int, list)>
+        """
+        shards = self.shards
+        pool = ThreadPool(self._workers)
+        pending = deque()
+        queue = deque(range(self._done, len(shards)))
+        try:
+            while queue or pending:
+                while queue and len(pending) < self._workers * 2:
+                    index = queue.popleft()
+                    pending.append((index, pool.apply_async(self._list, (shards[index],))))
+
+                index, result = pending.popleft()
+                yield index, result.get()
+
+                self._done = index + 1
+                self._save()
+        finally:
+            pool.terminate()
+
+        if self._checkpoint and os.path.exists(self._checkpoint):
+            os.remove(self._checkpoint)
+
+    def _list(self, specs):
+        """Runs the command for a shard"""
+        result = self._connection.runArgs(self._command, specs, partial=True)
+        log_errors(result, 'Unable to crawl: {}')
+
+        return result.records
+
+    def _load(self):
+        """Loads the shards from the checkpoint or splits the tree"""
+        if self._checkpoint and os.path.exists(self._checkpoint):
+            with io.open(self._checkpoint, 'r', encoding='utf8') as fh:
+                state = json.load(fh)
+            if state.get('root') == self._root and state.get('command') == self._command:
+                self._shards = state['shards']
+                self._done = state['done']
+                LOGGER.info('Resuming crawl of {} at shard {} of {}'.format(self._root, self._done,
+                                                                           len(self._shards)))
+                return
+
+        self._shards = self._split()
+        self._done = 0
+        self._save()
+
+    def _save(self):
+        """Writes the checkpoint"""
+        if not self._checkpoint:
+            return
+
+        state = {'root': self._root, 'command': self._command, 'shards': self._shards, 'done': self._done}
+        temp = self._checkpoint + '.tmp'
+        with io.open(temp, 'w', encoding='utf8') as fh:
+            fh.write(six.text_type(json.dumps(state)))
+        if six.PY3:
+            os.replace(temp, self._checkpoint)
+        else:
+            if os.path.exists(self._checkpoint):
+                os.remove(self._checkpoint)
+            os.rename(temp, self._checkpoint)
+
+    def _split(self):
+        """Splits the tree into shards of roughly balanced size"""
+        pieces = []
+        level = [self._root]
+        while level:
+            sizes = self._sizes([d + '/...' for d in level])
+            split = []
+            for directory in level:
+                count = sizes.get(directory + '/...', 0)
+                if not count:
+                    continue
+                if count <= self._shardsize:
+                    pieces.append((directory + '/...', count))
+                else:
+                    split.append(directory)
+
+            level = []
+            if split:
+                # -- Files directly in a split directory are their own piece
+                for spec, count in six.iteritems(self._sizes([d + '/*' for d in split])):
+                    if count:
+                        pieces.append((spec, count))
+                result = self._connection.runArgs(['dirs'], [d + '/*' for d in split], partial=True)
+                level = sorted(r['dir'] for r in result.records if 'dir' in r)
+
+        # -- Pack neighbouring pieces together in a stable order
+        shards = []
+        current, size = [], 0
+        for spec, count in sorted(pieces):
+            if current and size + count > self._shardsize:
+                shards.append(current)
+                current, size = [], 0
+            current.append(spec)
+            size += count
+        if current:
+            shards.append(current)
+
+        LOGGER.info('Split {} into {} shards'.format(self._root, len(shards)))
+
+        return shards
+
+    def _sizes(self, specs):
+        """Counts the files of many filespecs with a single ``sizes -s``"""
+        counts = dict.fromkeys(specs, 0)
+        for record in self._connection.runArgs(['sizes', '-s'], specs, partial=True).records:
+            if record.get('path') in counts:
+                counts[record['path']] = int(record.get('fileCount', 0))
+
+        return counts
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+"""
+perforce.export
+~~~~~~~~~~~~~~~
+
+This module implements exporting the files of a filespec to a directory or tar archive without a workspace, see
+:meth:`.Connection.export`
+
+:copyright: (c) 2015 by Brett Dixon
+:license: MIT, see LICENSE for more details
+"""
+
+import os
+import io
+import time
+import gzip
+import shutil
+import logging
+import tarfile
+import tempfile
+from collections import namedtuple, deque
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from . import cache as revcache
+from .api import connect
+from .models import RE_WILDCARD
+
+
+LOGGER = logging.getLogger(__name__)
+#: Bytes of printed contents each batch keeps in memory before spooling to disk when writing an archive
+SPOOL_SIZE = 8 * 1024 * 1024
+#: Destination suffixes that are written as tar archives
+ARCHIVE_SUFFIXES = ('.tar', '.tar.gz', '.tgz')
+#: Summary of an export
+ExportResult = namedtuple('ExportResult', 'files, bytes, seconds')
+
+
+class Segment(io.RawIOBase):
+    """A read-only view of a range of a file, used to store part of a spool file in the cache
+
+    :param fileobj: File to read from
+    :type fileobj: file
+    :param offset: Start of the range
+    :type offset: int
+    :param length: Size of the range
+    :type length: int
+    """
+    def __init__(self, fileobj, offset, length):
+        super(Segment, self).__init__()
+        self._fileobj = fileobj
+        self._offset = offset
+        self._remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if not size:
+            return 0
+
+        self._fileobj.seek(self._offset)
+        data = self._fileobj.read(size)
+        buffer[:len(data)] = data
+        self._offset += len(data)
+        self._remaining -= len(data)
+
+        return len(data)
+
+
+class Exporter(object):
+    """Exports the files of a filespec, such as ``//depot/release/...@1234``, without a workspace.
+
+    The files are listed once with ``files`` and printed in batches by a pool of concurrent ``print`` processes.
+    The output is written into a directory tree, or into a tar archive when ``dest`` is a writable file object or a
+    path ending in ``.tar``, ``.tar.gz`` or ``.tgz``.  Only one output file per batch is open at a time, files are
+    closed as soon as the next one starts.  For archives each batch is printed into a single spool that moves to
+    disk past :data:`SPOOL_SIZE` bytes, so memory stays bounded for files of any size.  Archive members are written
+    in depot path order with the change time and fixed ownership so identical snapshots produce identical
+    archives.  Paths are relative to the directory of the filespec before the first wildcard.  Revisions found in
+    the connection cache are not printed and printed revisions are added to it.
+
+    :param filespec: Files to export
+    :type filespec: str
+    :param dest: Directory, archive path or file object to write to
+    :type dest: str
+    :param connection: Connection object to use
+    :type connection: :py:class:`Connection`
+    :param workers: Number of print processes to run at once
+    :type workers: int
+    :param batchsize: Number of files to print per process
+    :type batchsize: int
+    """
+    def __init__(self, filespec, dest, connection=None, workers=4, batchsize=100):
+        self._connection = connection or connect()
+        self._filespec = filespec
+        self._dest = dest
+        self._workers = workers
+        self._batchsize = batchsize
+        self._archive = None
+
+        prefix = RE_WILDCARD.split(six.text_type(filespec).split('@')[0].split('#')[0])[0]
+        self._prefix = prefix[:prefix.rfind('/') + 1]
+
+    def __repr__(self):
+        return '<{}: {}>'.format(self.__class__.__name__, self._filespec)
+
+    @property
+    def isArchive(self):
+        """Is the output a tar archive"""
+        return hasattr(self._dest, 'write') or str(self._dest).endswith(ARCHIVE_SUFFIXES)
+
+    def run(self):
+        """Exports the files
+
+        :returns: :class:`ExportResult`
+        """
+        start = time.time()
+        files = sorted((r for r in self._connection.iterRun(['files', '-e', self._filespec])
+                        if r.get('code') != 'error'), key=lambda r: r['depotFile'])
+
+        fileobj = stream = None
+        if self.isArchive:
+            fileobj = self._dest if hasattr(self._dest, 'write') else open(str(self._dest), 'wb')
+            stream = fileobj
+            if str(self._dest).endswith(('.gz', '.tgz')):
+                stream = gzip.GzipFile(filename='', mode='wb', fileobj=fileobj, mtime=0)
+            self._archive = tarfile.open(fileobj=stream, mode='w|', format=tarfile.GNU_FORMAT)
+
+        count = size = 0
+        pool = ThreadPool(self._workers)
+        pending = deque()
+        batches = deque(files[i:i + self._batchsize] for i in range(0, len(files), self._batchsize))
+        try:
+            while batches or pending:
+                # -- Keep a bounded number of batches in flight and consume them in order
+                while batches and len(pending) < self._workers * 2:
+                    pending.append(pool.apply_async(self._fetch, (batches.popleft(),)))
+                spool, entries = pending.popleft().get()
+                try:
+                    for record, offset, length in entries:
+                        count += 1
+                        size += length
+                        if spool is not None:
+                            self._addMember(record, spool, offset, length)
+                finally:
+                    if spool is not None:
+                        spool.close()
+        finally:
+            pool.terminate()
+            if self._archive is not None:
+                self._archive.close()
+                self._archive = None
+                if stream is not fileobj:
+                    stream.close()
+                if fileobj is not self._dest:
+                    fileobj.close()
+
+        seconds = time.time() - start
+        LOGGER.info('Exported {} files, {} bytes in {:.1f}s ({:.1f} MB/s)'.format(
+            count, size, seconds, size / 1048576.0 / max(seconds, 0.001)))
+
+        return ExportResult(count, size, seconds)
+
+    def _relative(self, depotfile):
+        """Path of a file in the output"""
+        if depotfile.startswith(self._prefix):
+            return depotfile[len(self._prefix):]
+
+        return depotfile.lstrip('/')
+
+    def _open(self, depotfile):
+        """Opens the output file of a file in a directory export"""
+        filename = os.path.join(str(self._dest), *self._relative(depotfile).split('/'))
+        if not os.path.isdir(os.path.dirname(filename)):
+            try:
+                os.makedirs(os.path.dirname(filename))
+            except OSError:
+                # -- Created by another worker
+                pass
+
+        return open(filename, 'wb')
+
+    def _fetch(self, batch):
+        """Writes the files of a batch from the cache or a single ``print``, returns the spool of an archive
+        export and the record, offset and length of each file in depot path order"""
+        connection = self._connection
+        revisions = connection.cache
+        spool = tempfile.SpooledTemporaryFile(SPOOL_SIZE) if self._archive is not None else None
+        entries = []
+        misses = []
+        try:
+            for record in batch:
+                cached = revisions.open(revcache.key(record, connection._port)) if revisions else None
+                if cached is None:
+                    misses.append(record)
+                    continue
+                with cached:
+                    output = spool if spool is not None else self._open(record['depotFile'])
+                    offset = output.tell()
+                    shutil.copyfileobj(cached, output)
+                    entries.append(self._finish([record, output, offset, output.tell() - offset], spool, False))
+
+            if misses:
+                entries += self._print(misses, spool)
+        except BaseException:
+            if spool is not None:
+                spool.close()
+            raise
+
+        return spool, sorted(entries, key=lambda e: e[0]['depotFile'])
+
+    def _print(self, misses, spool):
+        """Prints files with a single ``print``, each output is finished as soon as the next file starts.  Files that
+        cannot be printed are logged and skipped, system errors raise"""
+        connection = self._connection
+        records = dict((r['depotFile'], r) for r in misses)
+        specs = '\n'.join('{}#{}'.format(r['depotFile'], r['rev']) for r in misses).encode('utf8')
+        entries = []
+        current = None
+        proc, command = connection._popen(['-x', '-', 'print'], specs, True)
+        try:
+            for raw in connection._records(proc, command, decode=False, partial=True):
+                code = raw.get(b'code')
+                if code == b'stat':
+                    if current is not None:
+                        entries.append(self._finish(current, spool))
+                        current = None
+                    depotfile = raw[b'depotFile'].decode('utf8')
+                    output = spool if spool is not None else self._open(depotfile)
+                    current = [records.get(depotfile, {'depotFile': depotfile}), output, output.tell(), 0]
+                elif code == b'error':
+                    LOGGER.warn(raw.get(b'data', b'').decode('utf8', 'ignore').strip())
+                elif current is not None:
+                    current[1].write(raw[b'data'])
+                    current[3] += len(raw[b'data'])
+
+            if current is not None:
+                entries.append(self._finish(current, spool))
+                current = None
+        finally:
+            if current is not None and spool is None:
+                current[1].close()
+
+        return entries
+
+    def _finish(self, current, spool, store=True):
+        """Closes the output of a file in a directory export and adds printed files to the cache"""
+        record, output, offset, length = current
+        revisions = self._connection.cache
+        name = revcache.key(record, self._connection._port) if revisions and store else None
+        if spool is None:
+            output.close()
+            if name:
+                revisions.put(name, output.name)
+            modtime = int(record.get('time', 0))
+            if modtime:
+                os.utime(output.name, (modtime, modtime))
+        elif name:
+            revisions.put(name, Segment(spool, offset, length))
+            spool.seek(0, os.SEEK_END)
+
+        return record, offset, length
+
+    def _addMember(self, record, spool, offset, length):
+        """Adds a file from a batch spool to the archive"""
+        filetype = record.get('type', '')
+        info = tarfile.TarInfo(self._relative(record['depotFile']))
+        info.size = length
+        info.mtime = int(record.get('time', 0))
+        info.mode = 0o755 if '+x' in filetype or filetype.startswith(('xtext', 'xbinary')) else 0o644
+        spool.seek(offset)
+        self._archive.addfile(info, spool)
+
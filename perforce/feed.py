@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+"""
+perforce.feed
+~~~~~~~~~~~~~
+
+This module implements a feed of newly submitted changelists
+
+:copyright: (c) 2015 by Brett Dixon
+:license: MIT, see LICENSE for more details
+"""
+
+import os
+import io
+import re
+import json
+import random
+import logging
+import threading
+import traceback
+
+import six
+
+from .api import connect
+from .models import Changelist, log_errors
+
+
+LOGGER = logging.getLogger(__name__)
+#: Seconds between polls
+POLL_INTERVAL = 30
+#: Most changes delivered by a single poll
+PAGE_SIZE = 500
+
+RE_DEPOTFILE = re.compile(r'^depotFile\d+$')
+
+
+class ChangeFeed(object):
+    """Delivers changelists submitted after a high-water mark to subscribers, oldest first
+
+    Each poll runs ``changes -s submitted`` for changes above the mark, or ``review -t`` when a review ``counter`` is
+    given, and describes the new changes with a single ``describe -s``.  Library caches on the connection are
+    invalidated for the new changes before subscribers are called with each :class:`.Changelist` and the depot paths
+    it affected.  The mark is kept in the review counter or in an optional ``state`` file so a restarted service
+    continues where it stopped, without either the feed starts at the newest change.
+
+    :param connection: Connection object to use
+    :type connection: :py:class:`Connection`
+    :param filespec: Only changes affecting these files
+    :type filespec: str
+    :param since: Change number to start after, overrides the saved mark
+    :type since: int
+    :param state: Optional path of a file to keep the mark in
+    :type state: str
+    :param counter: Optional review counter to read new changes from and advance, changes are not limited to the
+        filespec in this mode
+    :type counter: str
+    :param interval: Seconds between polls when started
+    :type interval: int
+    """
+    def __init__(self, connection=None, filespec=None, since=None, state=None, counter=None,
+                 interval=POLL_INTERVAL):
+        self._connection = connection or connect()
+        self._filespec = filespec
+        self._state = state
+        self._counter = counter
+        self._interval = interval
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._mark = int(since) if since is not None else self._load()
+
+    def __repr__(self):
+        return '<{}: {}@{}>'.format(self.__class__.__name__, self._filespec or '//...', self._mark)
+
+    @property
+    def mark(self):
+        """The newest change number delivered"""
+        return self._mark
+
+    @property
+    def running(self):
+        """Is the polling thread running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def subscribe(self, callback):
+        """Calls a function with each new :class:`.Changelist` and the list of depot paths it affected
+
+        :param callback: Function to call
+        :type callback: callable
+        """
+        self._callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        """Stops calling a function for new changes
+
+        :param callback: Function to remove
+        :type callback: callable
+        """
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def poll(self):
+        """Fetches and delivers the changes submitted since the mark
+
+        :returns: list<:class:`.Changelist`>, oldest first
+        """
+        with self._lock:
+            numbers = self._newChanges()
+            if not numbers:
+                return []
+
+            result = self._connection.runArgs(['describe', '-s'], numbers, partial=True)
+            log_errors(result, 'Unable to describe change: {}')
+            records = sorted((r for r in result.records if 'change' in r), key=lambda r: int(r['change']))
+
+            changes = []
+            for record in records:
+                keys = sorted((k for k in record if RE_DEPOTFILE.match(k)), key=lambda k: int(k[9:]))
+                paths = [record[k] for k in keys]
+                self._connection.invalidate(changes=[record['change'], record.get('oldChange')], paths=paths)
+                change = Changelist.fromRecord(record, self._connection)
+                changes.append(change)
+
+                for callback in list(self._callbacks):
+                    try:
+                        callback(change, paths)
+                    except Exception:
+                        LOGGER.error(traceback.format_exc())
+
+                self._mark = max(self._mark, int(record['change']))
+
+            self._save()
+
+            return changes
+
+    def start(self):
+        """Starts polling on a daemon thread"""
+        if self.running:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='perforce-feed')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops polling and waits for the thread to finish"""
+        self._stop.set()
+        if self.running and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        """Polls until stopped"""
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                LOGGER.error(traceback.format_exc())
+            self._stop.wait(self._interval * random.uniform(0.9, 1.1))
+
+    def _newChanges(self):
+        """Change numbers above the mark, oldest first"""
+        if self._counter:
+            records = self._connection.run(['review', '-t', self._counter])
+            numbers = [int(r['change']) for r in records if 'change' in r]
+        else:
+            spec = '{}@{},@now'.format(self._filespec or '//...', self._mark + 1)
+            records = self._connection.run(['changes', '-s', 'submitted', spec])
+            numbers = [int(r['change']) for r in records if 'change' in r]
+
+        return sorted(n for n in numbers if n > self._mark)[:PAGE_SIZE]
+
+    def _load(self):
+        """Reads the mark from the counter or state file, defaulting to the newest change"""
+        if self._counter:
+            records = self._connection.run(['counter', self._counter])
+            if records and int(records[0].get('value', 0)):
+                return int(records[0]['value'])
+
+        if self._state and os.path.exists(self._state):
+            with io.open(self._state, 'r', encoding='utf8') as fh:
+                return int(json.load(fh)['change'])
+
+        cmd = ['changes', '-s', 'submitted', '-m', '1'] + ([self._filespec] if self._filespec else [])
+        records = self._connection.run(cmd)
+
+        return int(records[0]['change']) if records else 0
+
+    def _save(self):
+        """Stores the mark in the counter and state file"""
+        if self._counter:
+            self._connection.run(['counter', self._counter, str(self._mark)])
+
+        if self._state:
+            temp = self._state + '.tmp'
+            with io.open(temp, 'w', encoding='utf8') as fh:
+                fh.write(six.text_type(json.dumps({'change': self._mark})))
+            if six.PY3:
+                os.replace(temp, self._state)
+            else:
+                if os.path.exists(self._state):
+                    os.remove(self._state)
+                os.rename(temp, self._state)
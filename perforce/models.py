@@ -10,6 +10,9 @@ This module implements the main data models used by perforce
 :license: MIT, see LICENSE for more details
 """
 
+import io
+import time
+import shutil
 import subprocess
 import datetime
 import traceback
@@ -17,18 +20,32 @@ import os
 import marshal
 import logging
 import re
-from collections import namedtuple
+import random
+import itertools
+import threading
+from collections import namedtuple, OrderedDict, deque
 from functools import wraps
 
-import path
+# -- path and multiprocessing are slow to import and only needed by a few methods, they are imported
+# -- where they are used so importing this module stays fast
 import six
 
 from perforce import errors
+from perforce import cache as revcache
+from perforce import columns
+from perforce.results import ResultSet
 
 
 LOGGER = logging.getLogger(__name__)
 CHAR_LIMIT = 8000
+#: Buffer size used when streaming file contents
+CHUNK_SIZE = 1024 * 1024
+#: Seconds read-only spec queries are cached for by :meth:`Connection.runCached`
+SPEC_TTL = 30
+#: Seconds between polls of a :class:`StatusMonitor`
+MONITOR_INTERVAL = 30
 DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+REVSPEC_DATE_FORMAT = "%Y/%m/%d:%H:%M:%S"
 FORMAT = """Change: {change}
 
 Client: {client}
@@ -62,8 +79,25 @@ ErrorLevel = namedtuple('ErrorLevel', 'EMPTY, INFO, WARN, FAILED, FATAL')(*range
 ConnectionStatus = namedtuple('ConnectionStatus', 'OK, OFFLINE, NO_AUTH, INVALID_CLIENT')(*range(4))
 #: File spec http://www.perforce.com/perforce/doc.current/manuals/cmdref/filespecs.html
 FileSpec = namedtuple('FileSpec', 'depot,client')
+#: Records of a command run with ``partial=True``, error records at or above the connection level are collected in
+#: errors and lower severity error records in warnings
+CommandResult = namedtuple('CommandResult', 'records, errors, warnings')
+#: Outcome of unshelving into one client, see :meth:`Changelist.unshelveInto`
+UnshelveResult = namedtuple('UnshelveResult', 'client, records, errors, seconds')
+
+DIGEST_FIELDS = ('digest', 'fileSize')
+#: Fields always requested with a projection so the missing fields can be fetched later
+PROJECTION_FIELDS = ('depotFile', 'headRev')
 
 RE_FILESPEC = re.compile('^"?(//[\w\d\_\/\.\s]+)"?\s')
+RE_VIEWLINE = re.compile(r'"([^"]*)"|(\S+)')
+RE_WILDCARD = re.compile(r'(\.\.\.|\*|%%\d)')
+#: Messages of errors with the connection or login rather than a file, for servers that do not set a system generic
+RE_SYSTEM_ERROR = re.compile(r'(Connect to server failed|P4PASSWD|session has expired|please login)', re.I)
+#: Path of a spec in a spec depot, the spec type and name
+RE_SPEC_PATH = re.compile(r'^//[^/]+/(client|stream|user)/(.+)\.p4s$')
+#: Generic error codes of failures of the server, client program, configuration or network rather than a file
+SYSTEM_GENERICS = range(32, 39)
 
 
 def split_ls(func):
@@ -73,17 +107,22 @@ def split_ls(func):
     :type func: :py:class:Function
     """
     @wraps(func)
-    def wrapper(self, files, silent=True, exclude_deleted=False):
+    def wrapper(self, files, *args, **kwargs):
         if not isinstance(files, (tuple, list)):
             files = [files]
 
         counter = 0
         index = 0
         results = []
+        # -- A query limit applies to the whole call rather than each chunk
+        limit = getattr(kwargs.get('query'), 'count', None)
 
         while files:
+            if limit is not None and len(results) >= limit:
+                break
+
             if index >= len(files):
-                results += func(self, files, silent, exclude_deleted)
+                results += func(self, files, *args, **kwargs)
                 break
 
             length = len(str(files[index]))
@@ -93,18 +132,47 @@ def split_ls(func):
                 files = files[index:]
                 counter = 0
                 index = 0
-                results += func(self, runfiles, silent, exclude_deleted)
+                results += func(self, runfiles, *args, **kwargs)
                 runfiles = None
                 del runfiles
             else:
                 index += 1
                 counter += length
 
-        return results
+        return results if limit is None else results[:limit]
 
     return wrapper
 
 
+def filter_args(query=None, exclude_deleted=False):
+    """Builds the fstat arguments for a :class:`.query.Q` and the deleted file filter
+
+    :param query: Optional query
+    :type query: :class:`.query.Q`
+    :param exclude_deleted: Exclude deleted files
+    :type exclude_deleted: bool
+    :returns: list
+    """
+    args = []
+    filters = []
+    if exclude_deleted:
+        filters.append('^headAction=delete ^headAction=move/delete')
+
+    if query is not None:
+        flags, expression = query.compile()
+        args += flags
+        if expression:
+            filters.append(expression)
+
+    if len(filters) > 1:
+        filters = ['({})'.format(f) for f in filters]
+
+    if filters:
+        args += ['-F', ' & '.join(filters)]
+
+    return args
+
+
 def camel_case(string):
     """Makes a string camelCase
 
@@ -113,15 +181,264 @@ def camel_case(string):
     return ''.join((string[0].lower(), string[1:]))
 
 
+def normpath(filename):
+    """Normalizes a local or depot path so it can be used as a lookup key
+
+    :param filename: Path to normalize
+    :type filename: str
+    """
+    filename = six.text_type(filename).strip('"')
+    if filename.startswith('//'):
+        return filename
+
+    return os.path.normcase(os.path.abspath(filename))
+
+
+def system_error(record):
+    """Checks if a raw error record is a failure of the server, connection or login rather than of one of the files
+    or arguments of the command.  These are raised even in partial mode.
+
+    :param record: Undecoded error record
+    :type record: dict
+    :returns: bool
+    """
+    data = record.get(b'data', b'')
+    if isinstance(data, bytes):
+        data = data.decode('utf8', 'ignore')
+
+    return record.get(b'severity', 0) >= ErrorLevel.FATAL or record.get(b'generic', 0) in SYSTEM_GENERICS or \
+        RE_SYSTEM_ERROR.search(data) is not None
+
+
+def log_errors(result, message='{}'):
+    """Logs the error and warning records of a :class:`CommandResult`
+
+    :param result: Partial result
+    :type result: :class:`CommandResult`
+    :param message: Format string for each record message
+    :type message: str
+    :returns: int -- Number of records logged
+    """
+    records = result.errors + result.warnings
+    for record in records:
+        LOGGER.warn(message.format(record.get('data', '').strip()))
+
+    return len(records)
+
+
+def _covers(pattern, viewpath):
+    """Is a stream view path inside of a stream view pattern"""
+    if pattern == viewpath or pattern == '...':
+        return True
+
+    return pattern.endswith('/...') and viewpath.startswith(pattern[:-3])
+
+
+def _map_depot(entry, viewpath):
+    """Maps a view path inside of a resolved path entry to its depot path"""
+    kind, pattern, depotpath = entry
+    if pattern.endswith('...') and depotpath.endswith('...'):
+        return depotpath[:-3] + viewpath[len(pattern) - 3:]
+
+    return depotpath
+
+
+def resolve_paths(stream, parent=None):
+    """Resolves the Paths of a stream into (type, view path, depot path) entries, with the entries of its parent
+    already resolved.  Shared and isolated paths map to the stream itself, or to its parent for virtual streams,
+    imports without a depot path map to the parent, and paths the parent imports or excludes are inherited.
+    Entries are ordered from least to most specific so later entries win.
+
+    :param stream: Stream to resolve
+    :type stream: :class:`Stream`
+    :param parent: Resolved entries of the parent stream
+    :type parent: list
+    :returns: list
+    """
+    name = stream._p4dict['stream']
+    virtual = stream.type == 'virtual'
+    entries = []
+    for kind, viewpath, depotpath in stream.paths:
+        if kind == 'exclude' or (kind.startswith('import') and depotpath):
+            entries.append((kind, viewpath, depotpath))
+            continue
+
+        if parent is None:
+            if not kind.startswith('import'):
+                entries.append((kind, viewpath, '{}/{}'.format(name, viewpath)))
+            continue
+
+        covering = [e for e in parent if _covers(e[1], viewpath)]
+        if covering:
+            entry = covering[-1]
+            if entry[0] == 'exclude':
+                entries.append(entry[:1] + (viewpath, None))
+            elif entry[0].startswith('import') or kind.startswith('import') or virtual:
+                entries.append(('import' if virtual else entry[0] if entry[0].startswith('import') else kind,
+                                viewpath, _map_depot(entry, viewpath)))
+            else:
+                entries.append((kind, viewpath, '{}/{}'.format(name, viewpath)))
+
+        for entry in parent:
+            if entry[1] == viewpath or not _covers(viewpath, entry[1]):
+                continue
+            if entry[0] == 'exclude' or entry[0].startswith('import') or virtual:
+                entries.append(entry)
+            else:
+                entries.append((kind, entry[1], '{}/{}'.format(name, entry[1])))
+
+    return sorted(entries, key=lambda e: len(e[1].replace('...', '')))
+
+
+def view_lines(stream, entries, ignored=None):
+    """Turns resolved path entries, remaps and ignores of a stream into view lines
+
+    :param stream: Stream the entries belong to
+    :type stream: :class:`Stream`
+    :param entries: Entries from :func:`resolve_paths`
+    :type entries: list
+    :param ignored: Ignored paths, including those inherited from parents, defaults to the stream's own
+    :type ignored: list
+    :returns: list<:data:`FileSpec`>
+    """
+    name = stream._p4dict['stream']
+    view = []
+    for kind, viewpath, depotpath in entries or []:
+        if kind == 'exclude':
+            view.append(FileSpec('-{}/{}'.format(name, viewpath), viewpath))
+        else:
+            view.append(FileSpec(depotpath, viewpath))
+
+    for source, target in stream.remapped:
+        covering = [e for e in entries or [] if e[0] != 'exclude' and _covers(e[1], source)]
+        if covering:
+            view.append(FileSpec(_map_depot(covering[-1], source), target))
+
+    for ignore in stream.ignored if ignored is None else ignored:
+        viewpath = '...' + ignore if ignore.startswith(('.', '/')) else '.../' + ignore
+        view.append(FileSpec('-{}/{}'.format(name, viewpath), viewpath))
+
+    return view
+
+
+def match_records(files, records):
+    """Matches fstat-like records back to the local or depot paths that were queried.  Error and info records are
+    ignored
+
+    :param files: Paths that were queried
+    :type files: list
+    :param records: Records returned by the command
+    :type records: list
+    :returns: dict, path to record
+    """
+    lookup = {}
+    for f in files:
+        lookup[normpath(f)] = f
+
+    matched = {}
+    for record in records:
+        if record.get('code') in ('error', 'info'):
+            continue
+
+        for key in ('clientFile', 'depotFile'):
+            f = lookup.get(normpath(record.get(key, '')))
+            if f is not None:
+                matched[f] = record
+                break
+
+    return matched
+
+
+def change_fields(record):
+    """Converts a ``changes`` or ``describe`` record to the fields of a ``change -o`` spec
+
+    :param record: Record to convert
+    :type record: dict
+    """
+    fields = {
+        'change': record['change'],
+        'description': record.get('desc', ''),
+        'client': record.get('client'),
+        'user': record.get('user'),
+        'status': record.get('status'),
+        'date': datetime.datetime.fromtimestamp(int(record.get('time', 0))).strftime(DATE_FORMAT),
+    }
+    if 'changeType' in record:
+        fields['type'] = record['changeType']
+
+    return fields
+
+
+def revspec(value):
+    """Formats a change number or datetime for use in a revision specifier
+
+    :param value: Change number, datetime or revision specifier
+    :type value: int
+    """
+    if isinstance(value, datetime.datetime):
+        return value.strftime(REVSPEC_DATE_FORMAT)
+
+    return str(value)
+
+
+def change_args(changelist):
+    """The ``-c`` option of a command for a changelist, ``0`` or a :class:`.Default` changelist is the default
+    changelist and ``None`` adds no option
+
+    :param changelist: Changelist or change number
+    :type changelist: :class:`.Changelist`
+    :returns: list
+    """
+    if changelist is None:
+        return []
+    change = int(changelist)
+
+    return ['-c', str(change) if change else 'default']
+
+
+def normalize_description(description):
+    """Normalizes a changelist description for comparison
+
+    :param description: Description to normalize
+    :type description: str
+    """
+    return description.replace('\r\n', '\n').strip()
+
+
+def view_regex(pattern, flags=0):
+    """Compiles a perforce path pattern with ``...``, ``*`` and ``%%n`` wildcards to a regular expression
+
+    :param pattern: Depot or client pattern from a view
+    :type pattern: str
+    """
+    parts = []
+    for token in RE_WILDCARD.split(pattern):
+        if token == '...':
+            parts.append('.*')
+        elif RE_WILDCARD.match(token):
+            parts.append('[^/]*')
+        else:
+            parts.append(re.escape(token))
+
+    return re.compile(''.join(parts) + '$', flags)
+
+
 class Connection(object):
     """This is the connection to perforce and does all of the communication with the perforce server"""
-    def __init__(self, port=None, client=None, user=None, executable='p4', level=ErrorLevel.FAILED):
+    def __init__(self, port=None, client=None, user=None, executable='p4', level=ErrorLevel.FAILED, cache=None):
         self._executable = executable
         self._level = level
+        self._cache = None
+        self.cache = cache
 
         self._port = port
         self._client = client
         self._user = user
+        self._pending = PendingIndex(self)
+        self._specs = SpecCache(self)
+        self._monitor = None
+        self._streams = {}
+        self._streamViews = {}
         self.__getVariables()
 
         # -- Make sure we can even proceed with anything
@@ -182,6 +499,28 @@ and port')
         else:
             raise TypeError('{} not supported for client'.format(type(value)))
 
+        self._pending.clear()
+        self._specs.invalidate('info')
+
+    @property
+    def specs(self):
+        """The :class:`SpecCache` of read-only queries made through :meth:`runCached`"""
+        return self._specs
+
+    @property
+    def cache(self):
+        """The :class:`.RevisionCache` consulted before printing file contents, None if disabled"""
+        return self._cache
+
+    @cache.setter
+    def cache(self, value):
+        if value is None or isinstance(value, revcache.RevisionCache):
+            self._cache = value
+        elif isinstance(value, six.string_types):
+            self._cache = revcache.RevisionCache(value)
+        else:
+            raise TypeError('{} not supported for cache'.format(type(value)))
+
     @property
     def user(self):
         """The user used in perforce queries"""
@@ -199,14 +538,89 @@ and port')
 
     @property
     def status(self):
-        """The status of the connection to perforce"""
+        """The status of the connection to perforce, the last known status when a :meth:`monitor` is running"""
+        if self._monitor is not None and self._monitor.running and self._monitor.status is not None:
+            return self._monitor.status
+
+        return self._queryStatus(self.runCached)
+
+    def invalidate(self, changes=(), paths=()):
+        """Drops what the library caches on this connection about changes and paths that were changed elsewhere,
+        see :class:`.feed.ChangeFeed`.  Client, stream and user specs are recognized by their spec depot paths,
+        such as ``//spec/client/name.p4s``.
+
+        :param changes: Change numbers that were submitted or deleted
+        :type changes: list
+        :param paths: Depot paths that were changed
+        :type paths: list
+        """
+        for change in changes:
+            if change is not None:
+                self._pending.discard(change)
+
+        # -- Specs submitted to a spec depot drop their cached queries, other paths only drop the views of the
+        # -- streams they are in as stream specs are versioned with their paths
+        specs = {}
+        for path in paths:
+            match = RE_SPEC_PATH.match(path)
+            if match:
+                kind, name = match.groups()
+                specs.setdefault(kind, set()).add('//' + name if kind == 'stream' else name)
+            for key in [k for k in self._streamViews if any(path.startswith(name + '/') for name, _ in k)]:
+                del self._streamViews[key]
+
+        for kind, names in six.iteritems(specs):
+            self._specs.invalidate(kind, names)
+        for key in [k for k in self._streamViews if any(name in specs.get('stream', ()) for name, _ in k)]:
+            del self._streamViews[key]
+
+    def withClient(self, client):
+        """Gets a copy of the connection that runs commands in another client.  The copy shares the server, user
+        and revision cache but has its own spec cache, so no ``p4 set`` or server query is needed to make one.
+
+        :param client: Client name
+        :type client: str or :class:`.Client`
+        :returns: :class:`Connection`
+        """
+        connection = Connection.__new__(Connection)
+        connection.__dict__.update(self.__dict__)
+        connection._client = client if isinstance(client, Client) else six.text_type(client)
+        connection._pending = PendingIndex(connection)
+        connection._specs = SpecCache(connection)
+        connection._monitor = None
+
+        return connection
+
+    def monitor(self, interval=MONITOR_INTERVAL, timeout=10, callback=None):
+        """Starts a :class:`StatusMonitor` that polls the server in the background so :attr:`status` returns
+        instantly.  Calling this again returns the running monitor.
+
+        :param interval: Seconds between polls while the connection is OK
+        :type interval: int
+        :param timeout: Seconds to wait for the server on each poll
+        :type timeout: int
+        :param callback: Optional callable subscribed to status changes
+        :type callback: callable
+        :returns: :class:`StatusMonitor`
+        """
+        if self._monitor is None or not self._monitor.running:
+            self._monitor = StatusMonitor(self, interval=interval, timeout=timeout)
+            self._monitor.start()
+
+        if callback is not None:
+            self._monitor.subscribe(callback)
+
+        return self._monitor
+
+    def _queryStatus(self, run):
+        """Checks the client and login with ``info`` and ``user -o`` run through a callable"""
         try:
             # -- Check client
-            res = self.run(['info'])
+            res = run(['info'])
             if res[0]['clientName'] == '*unknown*':
                 return ConnectionStatus.INVALID_CLIENT
-            # -- Trigger an auth error if not logged in
-            self.run(['user', '-o'])
+            # -- Trigger an auth error if not logged in, named so a change to the user spec can invalidate it
+            run(['user', '-o', self._user])
         except errors.CommandError as err:
             if 'password (P4PASSWD) invalid or unset' in str(err.args[0]):
                 return ConnectionStatus.NO_AUTH
@@ -215,20 +629,106 @@ and port')
 
         return ConnectionStatus.OK
 
-    def run(self, cmd, stdin=None, marshal_output=True, **kwargs):
+    def run(self, cmd, stdin=None, marshal_output=True, partial=False, budget=None, **kwargs):
         """Runs a p4 command and returns a list of dictionary objects
 
+        By default the first error record at or above the connection :attr:`level` raises and the records read so
+        far are lost.  With ``partial`` every record is read and the error records are returned next to the good
+        ones in a :class:`CommandResult`, so a batch with a few bad paths still costs a single process.  Fatal
+        errors and failures of the connection or login are not tied to a file and still raise, see
+        :func:`system_error`.  With a ``budget`` the records are collected in a :class:`.ResultSet` that writes
+        them to a temporary file once they take more than ``budget`` bytes, for queries too large to hold in
+        memory.
+
         :param cmd: Command to run
         :type cmd: list
         :param stdin: Standard Input to send to the process
         :type stdin: str
         :param marshal_output: Whether or not to marshal the output from the command
         :type marshal_output: bool
+        :param partial: Collect error records of files instead of raising
+        :type partial: bool
+        :param budget: Bytes of records to keep in memory before spilling to disk
+        :type budget: int
         :param kwargs: Passes any other keyword arguments to subprocess
         :raises: :class:`.error.CommandError`
-        :returns: list, records of results
+        :returns: list or :class:`.ResultSet`, records of results, or :class:`CommandResult` when partial
         """
-        records = []
+        if marshal_output and partial:
+            result = CommandResult([] if budget is None else ResultSet(budget=budget), [], [])
+            for record in self.iterRun(cmd, stdin, partial=True, **kwargs):
+                if record.get('code') != 'error':
+                    result.records.append(record)
+                elif int(record.get('severity', 0)) >= self._level:
+                    result.errors.append(record)
+                else:
+                    result.warnings.append(record)
+
+            return result
+
+        if marshal_output and budget is not None:
+            return ResultSet(self.iterRun(cmd, stdin, **kwargs), budget)
+
+        if marshal_output:
+            return list(self.iterRun(cmd, stdin, **kwargs))
+
+        proc, command = self._popen(cmd, stdin, False, **kwargs)
+        records, stderr = proc.communicate()
+
+        if stderr:
+            raise errors.CommandError(stderr, command)
+
+        return records
+
+    def runCached(self, cmd):
+        """Runs a read-only p4 command, such as ``info`` or ``client -o``, through the connection :attr:`specs`
+        cache.  Results are shared by every object on the connection for :data:`SPEC_TTL` seconds or until the
+        matching spec is saved through this library.
+
+        :param cmd: Command to run
+        :type cmd: list
+        :raises: :class:`.error.CommandError`
+        :returns: list, copies of the records of results
+        """
+        return self._specs.get(cmd)
+
+    def iterRun(self, cmd, stdin=None, partial=False, **kwargs):
+        """Runs a p4 command and yields the records as they are read from the process rather than collecting them,
+        so any number of records can be processed with bounded memory.  Closing the generator early kills the
+        process.
+
+        :param cmd: Command to run
+        :type cmd: list
+        :param stdin: Standard Input to send to the process
+        :type stdin: str
+        :param partial: Yield error records of files instead of raising
+        :type partial: bool
+        :param kwargs: Passes any other keyword arguments to subprocess
+        :raises: :class:`.error.CommandError`
+        :returns: generator, records of results
+        """
+        proc, command = self._popen(cmd, stdin, True, **kwargs)
+
+        return self._records(proc, command, partial=partial)
+
+    def runStream(self, cmd, buffering=CHUNK_SIZE, **kwargs):
+        """Runs a p4 command and returns its raw output as a read-only binary file object, so output of any size
+        can be consumed with bounded memory.  Closing the file before the end kills the process.
+
+        :param cmd: Command to run
+        :type cmd: list
+        :param buffering: Size of the read buffer
+        :type buffering: int
+        :param kwargs: Passes any other keyword arguments to subprocess
+        :raises: :class:`.error.CommandError`
+        :returns: :class:`io.BufferedReader`
+        """
+        proc, command = self._popen(cmd, None, False, **kwargs)
+
+        return io.BufferedReader(CommandStream(proc, command), buffering)
+
+    def _popen(self, cmd, stdin, marshal_output, **kwargs):
+        """Starts the p4 process for :meth:`run` and :meth:`iterRun`"""
         args = [self._executable, "-u", self._user, "-p", self._port]
 
         if self._client:
@@ -259,35 +759,73 @@ and port')
         )
 
         if stdin:
-            proc.stdin.write(six.b(stdin))
+            proc.stdin.write(stdin if isinstance(stdin, six.binary_type) else six.b(stdin))
+            if marshal_output:
+                # -- Nothing else will be written, p4 waits for EOF when reading arguments from stdin
+                proc.stdin.close()
 
-        if marshal_output:
-            try:
-                while True:
+        return proc, command
+
+    def _records(self, proc, command, decode=True, partial=False):
+        """Reads marshaled records from a running process, keys and values are left as bytes unless decoded and
+        error records only raise when not partial"""
+        finished = False
+        try:
+            while True:
+                try:
                     record = marshal.load(proc.stdout)
-                    if record.get(b'code', '') == b'error' and record[b'severity'] >= self._level:
-                        proc.stdin.close()
-                        proc.stdout.close()
-                        raise errors.CommandError(record[b'data'], record, command)
-                    if isinstance(record, dict):
-                        if six.PY2:
-                            records.append(record)
-                        else:
-                            records.append({str(k, 'utf8'): str(v) if isinstance(v, int) else str(v, 'utf8', errors='ignore') for k, v in record.items()})
-            except EOFError:
-                pass
-
-            stdout, stderr = proc.communicate()
-        else:
-            records, stderr = proc.communicate()
+                except EOFError:
+                    break
+                if record.get(b'code', '') == b'error' and record[b'severity'] >= self._level and \
+                        (not partial or system_error(record)):
+                    raise errors.CommandError(record[b'data'], record, command)
+                if isinstance(record, dict):
+                    if six.PY2 or not decode:
+                        yield record
+                    else:
+                        yield {str(k, 'utf8'): str(v) if isinstance(v, int) else str(v, 'utf8', errors='ignore') for k, v in record.items()}
+
+            for pipe in (proc.stdin, proc.stdout):
+                if not pipe.closed:
+                    pipe.close()
+            stderr = proc.stderr.read()
+            proc.stderr.close()
+            proc.wait()
+            finished = True
+            if stderr:
+                raise errors.CommandError(stderr, command)
+        finally:
+            if not finished:
+                for pipe in (proc.stdin, proc.stdout, proc.stderr):
+                    if not pipe.closed:
+                        pipe.close()
+                if proc.poll() is None:
+                    proc.kill()
+                proc.wait()
+
+    def runArgs(self, cmd, files, batchsize=None, **kwargs):
+        """Runs a p4 command passing the files through an argument file (``p4 -x -``) rather than the command
+        line, so any number of files costs a single process
 
-        if stderr:
-            raise errors.CommandError(stderr, command)
+        :param cmd: Command to run
+        :type cmd: list
+        :param files: Files to send as arguments
+        :type files: list
+        :param batchsize: Number of files p4 passes to each run of the command (``-b``), 1 for commands that only
+            accept a single argument
+        :type batchsize: int
+        :param kwargs: Passes any other keyword arguments to :meth:`run`
+        :returns: list, records of results
+        """
+        data = '\n'.join(six.text_type(f) for f in files).encode('utf8')
+        options = ['-x', '-']
+        if batchsize:
+            options += ['-b', str(batchsize)]
 
-        return records
+        return self.run(options + cmd, stdin=data, **kwargs)
 
     @split_ls
-    def ls(self, files, silent=True, exclude_deleted=False):
+    def ls(self, files, silent=True, exclude_deleted=False, digests=False, query=None, fields=None):
         """List files
 
         :param files: Perforce file spec
@@ -296,17 +834,36 @@ and port')
         :type silent: bool
         :param exclude_deleted: Exclude deleted files from the query
         :type exclude_deleted: bool
+        :param digests: Include the size and digest of each file
+        :type digests: bool
+        :param query: Filter applied by the server, see :class:`.query.Q`
+        :type query: :class:`.query.Q`
+        :param fields: Only return these fields with ``fstat -T``, other fields are fetched for all of the returned
+            revisions at once the first time one of them is needed
+        :type fields: list
         :raises: :class:`.errors.RevisionError`
         :returns: list<:class:`.Revision`>
         """
         try:
-            cmd = ['fstat']
-            if exclude_deleted:
-                cmd += ['-F', '^headAction=delete ^headAction=move/delete']
+            cmd = ['fstat'] + filter_args(query, exclude_deleted)
+
+            if fields:
+                fields = sorted(set(fields) | set(PROJECTION_FIELDS))
+                cmd += ['-T', ','.join(fields)]
+
+            if digests or (fields and any(f in DIGEST_FIELDS for f in fields)):
+                cmd.append('-Ol')
 
             cmd += files
 
-            results = self.run(cmd)
+            if silent:
+                # -- Keep the good records of a batch with bad paths
+                result = self.run(cmd, partial=True)
+                for record in result.errors:
+                    LOGGER.debug(record.get('data', '').strip())
+                results = result.records
+            else:
+                results = self.run(cmd)
         except errors.CommandError as err:
             if silent:
                 results = []
@@ -315,7 +872,85 @@ and port')
             else:
                 raise
 
-        return [Revision(r, self) for r in results if r.get('code') != 'error']
+        results = [r for r in results if r.get('code') != 'error']
+        if fields:
+            loader = FieldLoader(self, fields)
+            results = [loader.record(r) for r in results]
+
+        return [Revision(r, self) for r in results]
+
+    def lsColumns(self, filespec, fields=columns.DEFAULT_FIELDS, query=None):
+        """Streams ``fstat -T`` records into :class:`.columns.Columns` rather than :class:`.Revision` objects, so
+        millions of files can be aggregated without one Python object per file.  Integer and time fields are parsed
+        once into arrays, paths are packed into one buffer and other strings are dictionary encoded.  Records are
+        read undecoded and error records are skipped.
+
+        :param filespec: Perforce file spec, or a list of them
+        :type filespec: str
+        :param fields: Fields to load
+        :type fields: list
+        :param query: Filter applied by the server, see :class:`.query.Q`
+        :type query: :class:`.query.Q`
+        :returns: :class:`.columns.Columns`
+        """
+        specs = filespec if isinstance(filespec, (tuple, list)) else [filespec]
+        cmd = ['-x', '-', 'fstat', '-T', ','.join(fields)] + filter_args(query)
+        if any(f in DIGEST_FIELDS for f in fields):
+            cmd.append('-Ol')
+
+        data = '\n'.join(six.text_type(f) for f in specs).encode('utf8')
+        proc, command = self._popen(cmd, data, True)
+
+        table = columns.Columns(fields)
+        for record in self._records(proc, command, decode=False, partial=True):
+            if record.get(b'code') != b'error':
+                table.append(record)
+
+        return table
+
+    def fillDigests(self, revisions):
+        """Fetches the size and digest of many revisions with a single ``fstat -Ol`` and merges them into the
+        revisions that are missing either one
+
+        :param revisions: Revisions to fill
+        :type revisions: list<:class:`.Revision`>
+        :returns: list<:class:`.Revision`>
+        """
+        missing = {}
+        for rev in revisions:
+            if 'digest' not in rev._p4dict or 'fileSize' not in rev._p4dict:
+                missing.setdefault(rev._headSpec, []).append(rev)
+
+        if not missing:
+            return revisions
+
+        for record in self.runArgs(['fstat', '-Ol'], list(missing), partial=True).records:
+            spec = '{}#{}'.format(record['depotFile'], record['headRev']) if 'headRev' in record \
+                else record['depotFile']
+            for rev in missing.get(spec, missing.get(record['depotFile'], [])):
+                for key in DIGEST_FIELDS:
+                    if key in record:
+                        rev._p4dict[key] = record[key]
+
+        return revisions
+
+    def export(self, filespec, dest, workers=4, batchsize=100):
+        """Exports the files of a filespec, such as ``//depot/release/...@1234``, to a directory tree or tar archive
+        without a workspace, see :class:`.Exporter`
+
+        :param filespec: Files to export
+        :type filespec: str
+        :param dest: Directory, archive path or file object to write to
+        :type dest: str
+        :param workers: Number of print processes to run at once
+        :type workers: int
+        :param batchsize: Number of files to print per process
+        :type batchsize: int
+        :returns: :class:`.ExportResult`
+        """
+        from perforce.export import Exporter
+
+        return Exporter(filespec, dest, self, workers, batchsize).run()
 
     def findChangelist(self, description=None):
         """Gets or creates a Changelist object with a description
@@ -330,13 +965,13 @@ and port')
             if isinstance(description, six.integer_types):
                 change = Changelist(description, self)
             else:
-                pending = self.run(['changes', '-l', '-s', 'pending', '-c', str(self._client), '-u', self._user])
-                for cl in pending:
-                    if cl['desc'].strip() == description.strip():
-                        LOGGER.debug('Changelist found: {}'.format(cl['change']))
-                        change = Changelist(int(cl['change']), self)
-                        break
-                else:
+                change = None
+                number = self._pending.find(description)
+                if number is not None:
+                    LOGGER.debug('Changelist found: {}'.format(number))
+                    change = self._pending.get(number)
+
+                if change is None:
                     LOGGER.debug('No changelist found, creating one')
                     change = Changelist.create(description, self)
                     change.client = self._client
@@ -344,15 +979,179 @@ and port')
 
         return change
 
+    def streams(self, filter=None):
+        """Loads streams into a :class:`StreamGraph` with a single ``streams`` query and a single ``stream -o``
+        process, run once per name, for specs that are new or were updated since they were last loaded on this
+        connection.
+        Parents outside of the filter are loaded as well so views can be resolved locally.
+
+        :param filter: Optional ``streams -F`` expression, such as ``Type=release``
+        :type filter: str
+        :returns: :class:`StreamGraph`
+        """
+        cmd = ['streams']
+        if filter:
+            cmd += ['-F', filter]
+
+        listed = dict((r['Stream'], r) for r in self.run(cmd) if 'Stream' in r)
+        specs = {}
+        while listed:
+            fetch = []
+            for name, record in six.iteritems(listed):
+                cached = self._streams.get(name)
+                if cached is not None and cached[0] == record.get('Update'):
+                    specs[name] = cached[1]
+                else:
+                    fetch.append(name)
+
+            if fetch:
+                # -- stream -o only accepts one name
+                result = self.runArgs(['stream', '-o'], fetch, batchsize=1, partial=True)
+                log_errors(result, 'Unable to load stream: {}')
+                for record in result.records:
+                    fields = {camel_case(k): v for k, v in six.iteritems(record)}
+                    name = fields.get('stream')
+                    if name in listed:
+                        self._streams[name] = (listed[name].get('Update'), fields)
+                        specs[name] = fields
+
+            # -- Load missing parents
+            parents = set(f.get('parent') for f in specs.values()) - set(specs) - set([None, 'none'])
+            listed = {}
+            if parents:
+                result = self.runArgs(['streams'], sorted(parents), partial=True)
+                listed = dict((r['Stream'], r) for r in result.records if r.get('Stream') in parents)
+
+        return StreamGraph(self, [Stream.fromRecord(f, self) for f in specs.values()])
+
+    def changelists(self, numbers):
+        """Gets many changelists with a single ``describe -s``.  Like :meth:`iterChanges` the changelists are filled
+        from the records and only query the full spec or files when needed.
+
+        :param numbers: Changelist numbers
+        :type numbers: list
+        :returns: list<:class:`.Changelist`>
+        """
+        numbers = [int(n) for n in numbers]
+        if not numbers:
+            return []
+
+        records = {}
+        for record in self.runArgs(['describe', '-s'], numbers, partial=True).records:
+            if 'change' in record:
+                records[int(record['change'])] = record
+
+        return [Changelist.fromRecord(records[n], self) for n in numbers if n in records]
+
+    def iterChanges(self, filespec=None, status=None, user=None, client=None, since=None, until=None,
+                    pagesize=500):
+        """Walks changelist history, newest first, yielding :class:`.Changelist` objects filled from ``changes -l``
+        records without any further queries.
+
+        Submitted changes are fetched in pages of ``pagesize`` with ``-m`` and a revision range on ``filespec``, or
+        ``//...``, using the oldest change of each page as the cursor for the next one.  The next page is fetched in
+        the background while the current one is being processed.  Revision ranges only match submitted changes, so
+        any other status is read with a single streamed query and bounded by change number and time as it is read.
+
+        :param filespec: Only changes affecting these files
+        :type filespec: str
+        :param status: Only changes with this status, pending, shelved or submitted
+        :type status: str
+        :param user: Only changes by this user
+        :type user: str
+        :param client: Only changes from this client
+        :type client: str
+        :param since: Oldest change number or datetime to include
+        :type since: int
+        :param until: Newest change number or datetime to include
+        :type until: int
+        :param pagesize: Number of changes to fetch per query
+        :type pagesize: int
+        :returns: generator<:class:`.Changelist`>
+        """
+        from multiprocessing.pool import ThreadPool
+
+        cmd = ['changes', '-l']
+        if status:
+            cmd += ['-s', status]
+        if user:
+            cmd += ['-u', user]
+        if client:
+            cmd += ['-c', str(client)]
+
+        if status != 'submitted':
+            for change in self._streamChanges(cmd, filespec, since, until):
+                yield change
+            return
+
+        def page(cursor):
+            upper = cursor if cursor is not None else until
+            upper = 'now' if upper is None else revspec(upper)
+            if since is not None:
+                upper = '{},@{}'.format(revspec(since), upper)
+
+            return self.run(cmd + ['-m', str(pagesize), '{}@{}'.format(filespec or '//...', upper)])
+
+        pool = ThreadPool(1)
+        try:
+            cursor = None
+            pending = pool.apply_async(page, (cursor,))
+            while pending is not None:
+                records = pending.get()
+                pending = None
+                if len(records) >= pagesize:
+                    last = int(records[-1]['change']) - 1
+                    if 0 < last and (cursor is None or last < cursor) and \
+                            not (isinstance(since, six.integer_types) and last < since):
+                        cursor = last
+                        pending = pool.apply_async(page, (cursor,))
+
+                for record in records:
+                    yield Changelist.fromRecord(record, self)
+        finally:
+            pool.terminate()
+
+    def _streamChanges(self, cmd, filespec, since, until):
+        """Yields the changes of a single ``changes`` query between since and until, see :meth:`iterChanges`"""
+        def within(record, bound, newer):
+            if isinstance(bound, datetime.datetime):
+                value = datetime.datetime.fromtimestamp(int(record.get('time', 0)))
+            else:
+                value = int(record['change'])
+                bound = int(bound)
+
+            return value >= bound if newer else value <= bound
+
+        if isinstance(since, six.integer_types):
+            cmd = cmd + ['-e', str(since)]
+
+        records = self.iterRun(cmd + ([filespec] if filespec else []))
+        try:
+            for record in records:
+                if until is not None and not within(record, until, False):
+                    continue
+                if since is not None and not within(record, since, True):
+                    continue
+
+                yield Changelist.fromRecord(record, self)
+        finally:
+            records.close()
+
     def add(self, filename, change=None):
         """Adds a new file to a changelist
 
-        :param filename: File path to add
+        When given a list of files they are checked with a single :meth:`canAdd`, added with a single ``add``
+        and queried with a single ``fstat``.  Files that cannot be added are logged and skipped.
+
+        :param filename: File path to add, or a list of paths
         :type filename: str
         :param change: Changelist to add the file to
         :type change: int
-        :returns: :class:`.Revision`
+        :returns: :class:`.Revision` or list<:class:`.Revision`>
         """
+        if isinstance(filename, (tuple, list)):
+            return self._addFiles(filename, change)
+
         try:
             if not self.canAdd(filename):
                 raise errors.RevisionError('File is not under client path')
@@ -374,12 +1173,83 @@ and port')
 
         return rev
 
+    def _addFiles(self, files, change=None):
+        """Adds many files with one process per step, see :meth:`add`"""
+        verdicts = self.canAdd(files)
+        files = [f for f in files if verdicts[f]]
+        if not files:
+            return []
+
+        cmd = ['add'] + change_args(change)
+
+        try:
+            log_errors(self.runArgs(cmd, files, partial=True), 'Unable to add: {}')
+            results = self.runArgs(['fstat'], files, partial=True).records
+        except errors.CommandError as err:
+            LOGGER.debug(err)
+            raise errors.RevisionError('Files could not be added: {}'.format(err.args[0]))
+
+        revs = [Revision(r, self) for r in results]
+
+        if isinstance(change, Changelist):
+            if change._files is not None:
+                known = set(f.depotFile for f in change._files)
+                change._files += [r for r in revs if r.depotFile not in known]
+            for rev in revs:
+                rev._changelist = change
+
+        return revs
+
     def canAdd(self, filename):
         """Determines if a filename can be added to the depot under the current client
 
-        :param filename: File path to add
+        A list of files is first filtered locally against the client root and view, the rest are checked with a
+        single ``add -n``.  A single path goes straight to ``add -n`` so it does not cost a ``client -o``.
+
+        :param filename: File path to add, or a list of paths
         :type filename: str
+        :returns: bool, or a dict of path to bool when given a list
         """
+        if not isinstance(filename, (tuple, list)):
+            return self._canAdd(filename)
+
+        verdicts = dict.fromkeys(filename, False)
+        if len(verdicts) == 1:
+            verdicts[filename[0]] = self._canAdd(filename[0])
+            return verdicts
+
+        candidates = []
+        for f in verdicts:
+            if self.inView(f):
+                candidates.append(f)
+            else:
+                LOGGER.warn('Unable to add {}: not in client view'.format(f))
+
+        if len(candidates) == 1:
+            verdicts[candidates[0]] = self._canAdd(candidates[0])
+            return verdicts
+
+        if not candidates:
+            return verdicts
+
+        try:
+            result = self.runArgs(['add', '-n', '-t', 'text'], candidates, partial=True)
+        except errors.CommandError as err:
+            LOGGER.debug(err)
+            return verdicts
+
+        log_errors(result, 'Unable to add: {}')
+        for record in result.records:
+            if record.get('code') == 'info':
+                LOGGER.warn('Unable to add: {}'.format(record.get('data', '').strip()))
+
+        for f in match_records(candidates, result.records):
+            verdicts[f] = True
+
+        return verdicts
+
+    def _canAdd(self, filename):
+        """Runs ``add -n`` for a single file"""
         try:
             result = self.run(['add', '-n', '-t', 'text', filename])[0]
         except errors.CommandError as err:
@@ -393,6 +1263,366 @@ and port')
 
         return False
 
+    def inView(self, filename):
+        """Checks locally if a file is mapped by the client, see :meth:`Client.inView`.  If there is no client or
+        it cannot be loaded the server is left to decide
+
+        :param filename: Local, client or depot path
+        :type filename: str
+        :returns: bool
+        """
+        try:
+            client = self.client
+        except errors.CommandError as err:
+            LOGGER.debug(err)
+            return True
+
+        return client is None or client.inView(filename)
+
+
+def _unshelve(connection, change, changelist=None, force=False):
+    """Runs ``unshelve`` for a shelved changelist in the client of a connection and times it"""
+    cmd = ['unshelve', '-s', str(int(change))] + change_args(changelist)
+    if force:
+        cmd.append('-f')
+
+    start = time.time()
+    try:
+        result = connection.run(cmd, partial=True)
+        records, errs = result.records, result.errors
+    except (errors.CommandError, OSError, IOError) as err:
+        LOGGER.debug(err)
+        records, errs = [], [{'code': 'error', 'data': six.text_type(err.args[0])}]
+
+    return UnshelveResult(six.text_type(connection._client), records, errs, time.time() - start)
+
+
+class CommandStream(io.RawIOBase):
+    """The raw output of a running p4 command, see :meth:`Connection.runStream`"""
+    def __init__(self, proc, command):
+        super(CommandStream, self).__init__()
+        self._proc = proc
+        self._command = command
+        self._finished = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._finished:
+            return 0
+
+        count = self._proc.stdout.readinto(buffer)
+        if not count:
+            self._finish()
+
+        return count
+
+    def close(self):
+        if self.closed:
+            return
+
+        if not self._finished:
+            if self._proc.poll() is None:
+                self._proc.kill()
+            self._finish(check=False)
+        super(CommandStream, self).close()
+
+    def _finish(self, check=True):
+        """Waits for the process and raises any errors it printed"""
+        self._finished = True
+        for pipe in (self._proc.stdin, self._proc.stdout):
+            if not pipe.closed:
+                pipe.close()
+        stderr = self._proc.stderr.read() if not self._proc.stderr.closed else None
+        self._proc.stderr.close()
+        self._proc.wait()
+        if stderr and check:
+            raise errors.CommandError(stderr, self._command)
+
+
+class StatusMonitor(object):
+    """Polls the status of a connection on a background thread
+
+    The server, login and client are checked every ``interval`` seconds.  While the connection is not OK the
+    interval doubles up to ``maxinterval`` and every wait is jittered so many processes do not poll in step.
+    Subscribers are called with the old and new :data:`ConnectionStatus` whenever it changes.
+
+    :param connection: Connection to check
+    :type connection: :class:`Connection`
+    :param interval: Seconds between polls while the connection is OK
+    :type interval: int
+    :param timeout: Seconds to wait for the server on each poll
+    :type timeout: int
+    :param maxinterval: Longest wait between polls while the connection is not OK
+    :type maxinterval: int
+    :param jitter: Fraction of the wait to randomly add or remove
+    :type jitter: float
+    :param history: Number of latency samples to keep
+    :type history: int
+    """
+    def __init__(self, connection, interval=MONITOR_INTERVAL, timeout=10, maxinterval=300, jitter=0.1,
+                 history=100):
+        self._connection = connection
+        self._interval = interval
+        self._timeout = timeout
+        self._maxinterval = max(maxinterval, interval)
+        self._jitter = jitter
+        self._latency = deque(maxlen=history)
+        self._callbacks = []
+        self._status = None
+        self._checked = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return '<{}: {}, {}>'.format(self.__class__.__name__, self._connection, self._status)
+
+    @property
+    def status(self):
+        """The last known :data:`ConnectionStatus`, None before the first poll"""
+        return self._status
+
+    @property
+    def checked(self):
+        """The :class:`datetime.datetime` of the last poll"""
+        return self._checked
+
+    @property
+    def latency(self):
+        """List of (:class:`datetime.datetime`, seconds) for recent polls"""
+        return list(self._latency)
+
+    @property
+    def running(self):
+        """Is the monitor thread running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def subscribe(self, callback):
+        """Calls a function with the old and new status whenever the status changes
+
+        :param callback: Function to call
+        :type callback: callable
+        """
+        self._callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        """Stops calling a function on status changes
+
+        :param callback: Function to remove
+        :type callback: callable
+        """
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def start(self):
+        """Starts polling on a daemon thread"""
+        if self.running:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='perforce-monitor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops polling and waits for the thread to finish"""
+        self._stop.set()
+        if self.running and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def poll(self):
+        """Checks the status now, bypassing the connection spec cache
+
+        :returns: :data:`ConnectionStatus`
+        """
+        maxwait = ['-v', 'net.maxwait={}'.format(self._timeout)]
+        start = time.time()
+        try:
+            status = self._connection._queryStatus(lambda cmd: self._connection.run(maxwait + cmd))
+        except (OSError, IOError) as err:
+            LOGGER.debug(err)
+            status = ConnectionStatus.OFFLINE
+        self._checked = datetime.datetime.now()
+        self._latency.append((self._checked, time.time() - start))
+
+        previous, self._status = self._status, status
+        if status != previous:
+            LOGGER.info('Connection {} status changed from {} to {}'.format(self._connection, previous, status))
+            for callback in list(self._callbacks):
+                try:
+                    callback(previous, status)
+                except Exception:
+                    LOGGER.error(traceback.format_exc())
+
+        return status
+
+    def _run(self):
+        """Polls until stopped, backing off while the connection is not OK"""
+        wait = self._interval
+        while not self._stop.is_set():
+            if self.poll() == ConnectionStatus.OK:
+                wait = self._interval
+            else:
+                wait = min(wait * 2, self._maxinterval)
+            self._stop.wait(wait * (1 + random.uniform(-self._jitter, self._jitter)))
+
+
+class SpecCache(object):
+    """A cache of the records of read-only spec queries for a connection, keyed by command.
+
+    Entries expire after :attr:`ttl` seconds and :class:`FormObject` invalidates the entries for its command when
+    it is saved.  Callers get copies of the records so they can be changed freely.
+    """
+    def __init__(self, connection, ttl=SPEC_TTL):
+        self._connection = connection
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.ttl = ttl
+
+    def __contains__(self, cmd):
+        entry = self._entries.get(tuple(str(c) for c in cmd))
+
+        return entry is not None and entry[0] > time.time()
+
+    def get(self, cmd):
+        """Gets the records of a command, running it when not cached or expired
+
+        :param cmd: Command to run
+        :type cmd: list
+        :returns: list
+        """
+        key = tuple(str(c) for c in cmd)
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is None or entry[0] <= time.time():
+            records = self._connection.run(list(key))
+            entry = (time.time() + self.ttl, records)
+            if self.ttl > 0:
+                with self._lock:
+                    self._entries[key] = entry
+
+        return [dict(r) for r in entry[1]]
+
+    def invalidate(self, command, names=None):
+        """Removes every entry for a command, or only the entries for some specs
+
+        :param command: Command name, such as ``client``
+        :type command: str
+        :param names: Spec names, the last argument of the command, such as client names
+        :type names: list
+        """
+        names = None if names is None else set(six.text_type(n) for n in names)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == command and (names is None or k[-1] in names)]:
+                del self._entries[key]
+
+    def clear(self):
+        """Removes every entry"""
+        with self._lock:
+            self._entries.clear()
+
+
+class PendingIndex(object):
+    """An index of the pending changelists for a connection's client and user by description and number.
+
+    The index is loaded with a single ``changes`` call, lookups that miss only ask for changelists newer than the
+    last one seen and :class:`.Changelist` keeps the index up to date as changes are created, saved, submitted or
+    deleted through this library.  Changelists found in the index are built from the stored fields without any
+    server calls.
+    """
+    def __init__(self, connection):
+        self._connection = connection
+        self._changes = None
+        self._descriptions = {}
+        self._last = 0
+
+    def __contains__(self, number):
+        return self._changes is not None and int(number) in self._changes
+
+    def find(self, description):
+        """Finds the newest pending changelist number with a description
+
+        :param description: The description to lookup
+        :type description: str
+        :returns: int or None
+        """
+        key = normalize_description(description)
+        if self._changes is None:
+            self.refresh()
+        elif key not in self._descriptions:
+            self.refresh(incremental=True)
+
+        numbers = self._descriptions.get(key)
+
+        return max(numbers) if numbers else None
+
+    def get(self, number):
+        """Gets an indexed changelist
+
+        :param number: Changelist number
+        :type number: int
+        :returns: :class:`.Changelist`
+        """
+        return Changelist.fromRecord(self._changes[int(number)], self._connection)
+
+    def refresh(self, incremental=False):
+        """Loads the pending changelists from the server
+
+        :param incremental: Only load changelists newer than the last one seen
+        :type incremental: bool
+        """
+        connection = self._connection
+        cmd = ['changes', '-l', '-s', 'pending', '-c', str(connection._client), '-u', connection.user]
+        if incremental and self._changes is not None:
+            cmd += ['-e', str(self._last + 1)]
+        else:
+            self.clear()
+            self._changes = {}
+
+        for record in connection.run(cmd):
+            self.update(change_fields(record))
+
+    def update(self, fields):
+        """Adds or updates a pending changelist
+
+        :param fields: Changelist fields as returned by ``change -o``
+        :type fields: dict
+        """
+        if self._changes is None:
+            return
+
+        fields = dict(fields)
+        fields['client'] = str(fields.get('client'))
+        number = int(fields['change'])
+        self.discard(number)
+        self._changes[number] = fields
+        self._descriptions.setdefault(normalize_description(fields['description']), set()).add(number)
+        self._last = max(self._last, number)
+
+    def discard(self, number):
+        """Removes a changelist that is no longer pending
+
+        :param number: Changelist number
+        :type number: int
+        """
+        if not self._changes:
+            return
+
+        fields = self._changes.pop(int(number), None)
+        if fields is not None:
+            key = normalize_description(fields['description'])
+            self._descriptions[key].discard(int(number))
+            if not self._descriptions[key]:
+                del self._descriptions[key]
+
+    def clear(self):
+        """Forgets everything, the next lookup reloads the index"""
+        self._changes = None
+        self._descriptions = {}
+        self._last = 0
+
 
 @six.python_2_unicode_compatible
 class PerforceObject(object):
@@ -441,9 +1671,184 @@ class FormObject(PerforceObject):
             fields.append('{}:  {}'.format(key, value))
         form = '\n'.join(fields)
         self._connection.run([self.COMMAND, '-i'], stdin=form, marshal_output=False)
+        self._connection.specs.invalidate(self.COMMAND)
+        # -- info reports fields of the current client
+        self._connection.specs.invalidate('info')
         self._dirty = False
 
 
+class ProjectedRecord(dict):
+    """An fstat record loaded with a field projection.  Accessing or testing for a field outside of the projection
+    fetches the missing fields of every record from the same call through their :class:`FieldLoader`.
+    """
+    def __init__(self, record, loader):
+        super(ProjectedRecord, self).__init__(record)
+        self._loader = loader
+
+    def __missing__(self, key):
+        if self._loader is not None and key not in self._loader.fields and self._loader.load(key):
+            return self[key]
+
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key):
+            return True
+
+        if self._loader is not None and key not in self._loader.fields and self._loader.load(key):
+            return dict.__contains__(self, key)
+
+        return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    @property
+    def fields(self):
+        """Fields the record was loaded with, None once all fields are loaded"""
+        return None if self._loader is None else self._loader.fields
+
+
+class FieldLoader(object):
+    """Fetches the fields missing from a set of :class:`ProjectedRecord` with a single ``fstat``"""
+    def __init__(self, connection, fields):
+        self._connection = connection
+        self._records = []
+        self.fields = tuple(fields)
+
+    def record(self, record):
+        """Wraps a record so it loads its missing fields through this loader
+
+        :param record: fstat record
+        :type record: dict
+        :returns: :class:`ProjectedRecord`
+        """
+        record = ProjectedRecord(record, self)
+        self._records.append(record)
+
+        return record
+
+    def load(self, key=None):
+        """Fetches every field of the records, including the digests when the missing field is one
+
+        :param key: Field that was missing
+        :type key: str
+        :returns: bool, if the records were loaded
+        """
+        records, self._records = self._records, []
+        if not records:
+            return False
+
+        for record in records:
+            record._loader = None
+
+        cmd = ['fstat', '-Ol'] if key in DIGEST_FIELDS else ['fstat']
+        specs = dict(('{}#{}'.format(r['depotFile'], r['headRev']) if 'headRev' in r else r['depotFile'], r)
+                     for r in records)
+        LOGGER.debug('Loading {} for {} projected records'.format(key, len(specs)))
+        for full in self._connection.runArgs(cmd, list(specs), partial=True).records:
+            record = specs.get('{}#{}'.format(full['depotFile'], full.get('headRev'))) or \
+                specs.get(full['depotFile'])
+            if record is not None:
+                for k, v in six.iteritems(full):
+                    if k not in record:
+                        dict.__setitem__(record, k, v)
+
+        return True
+
+
+class RevisionSequence(object):
+    """A lazy, read-only sequence of :class:`.Revision` objects from an fstat query
+
+    Nothing is queried until the sequence is used.  Iterating streams records from the server and ``len()`` counts
+    a projected stream.  Indexing reads pages forward from one open query, so increasing indices read each record
+    once, and keeps only the most recently used pages in memory.  Going back before the query position starts the
+    query again.
+    """
+    PAGE_SIZE = 1000
+    PAGES = 4
+
+    def __init__(self, connection, cmd, pagesize=PAGE_SIZE):
+        self._connection = connection
+        self._cmd = list(cmd)
+        self._pagesize = pagesize
+        self._pages = OrderedDict()
+        self._len = None
+        self._stream = None
+        self._cursor = None
+        self._position = 0
+
+    def __repr__(self):
+        return '<RevisionSequence: {}>'.format(' '.join(self._cmd))
+
+    def __iter__(self):
+        for record in self._connection.iterRun(self._cmd):
+            if record.get('code') != 'error':
+                yield Revision(record, self._connection)
+
+    def __len__(self):
+        if self._len is None:
+            records = self._connection.iterRun(self._options('-T', 'depotFile'))
+            self._len = sum(1 for r in records if r.get('code') != 'error')
+
+        return self._len
+
+    def __nonzero__(self):
+        return bool(self._page(0))
+
+    __bool__ = __nonzero__
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return list(itertools.islice(self, start, stop, step))
+
+        if index < 0:
+            index += len(self)
+        if index < 0:
+            raise IndexError('RevisionSequence index out of range')
+
+        page, offset = divmod(index, self._pagesize)
+        records = self._page(page)
+        if offset >= len(records):
+            raise IndexError('RevisionSequence index out of range')
+
+        return Revision(records[offset], self._connection)
+
+    def _options(self, *options):
+        """The command with extra options before the file arguments"""
+        return self._cmd[:1] + list(options) + self._cmd[1:]
+
+    def _page(self, page):
+        """Gets a page of records, reading forward from the open query and restarting it only to go back"""
+        records = self._pages.pop(page, None)
+        if records is None:
+            start = page * self._pagesize
+            if self._cursor is None or self._position > start:
+                self._restart()
+            # -- Skip to the page, records already read past are not read again
+            self._position += sum(1 for _ in itertools.islice(self._cursor, start - self._position))
+            records = list(itertools.islice(self._cursor, self._pagesize))
+            self._position += len(records)
+            while len(self._pages) >= self.PAGES:
+                self._pages.popitem(last=False)
+
+        self._pages[page] = records
+
+        return records
+
+    def _restart(self):
+        """Starts the query again from the first record, killing the previous process"""
+        if self._stream is not None:
+            self._stream.close()
+        self._stream = self._connection.iterRun(self._cmd)
+        self._cursor = (r for r in self._stream if r.get('code') != 'error')
+        self._position = 0
+
+
 class Changelist(PerforceObject):
     """
     A Changelist is a collection of files that will be submitted as a single entry with a description and
@@ -457,6 +1862,7 @@ class Changelist(PerforceObject):
         self._files = None
         self._dirty = False
         self._reverted = False
+        self._partial = False
         self._change = changelist
 
         self.query(files=False)
@@ -470,6 +1876,8 @@ class Changelist(PerforceObject):
     def __nonzero__(self):
         return True
 
+    __bool__ = __nonzero__
+
     def __enter__(self):
         return self
 
@@ -544,6 +1952,7 @@ class Changelist(PerforceObject):
         if self._change:
             cl = str(self._change)
             self._p4dict = {camel_case(k): v for k, v in six.iteritems(self._connection.run(['change', '-o', cl])[0])}
+            self._partial = False
 
         if files:
             self._files = []
@@ -552,12 +1961,8 @@ class Changelist(PerforceObject):
                 data = self._connection.run(['opened', '-c', str(change)])
                 self._files = [Revision(r, self._connection) for r in data]
             else:
-                data = self._connection.run(['describe', str(self._change)])[0]
-                depotfiles = []
-                for k, v in six.iteritems(data):
-                    if k.startswith('depotFile'):
-                        depotfiles.append(v)
-                self._files = self._connection.ls(depotfiles)
+                change = str(self._change)
+                self._files = RevisionSequence(self._connection, ['fstat', '-e', change, '//...@={}'.format(change)])
 
     def append(self, rev):
         """Adds a :py:class:Revision to this changelist and adds or checks it out if needed
@@ -631,6 +2036,8 @@ class Changelist(PerforceObject):
         """Saves the state of the changelist"""
         self._connection.run(['change', '-i'], stdin=format(self), marshal_output=False)
         self._dirty = False
+        if self._p4dict.get('status') == 'pending':
+            self._connection._pending.update(self._p4dict)
 
     def submit(self):
         """Submits a chagelist to the depot"""
@@ -638,6 +2045,8 @@ class Changelist(PerforceObject):
             self.save()
 
         self._connection.run(['submit', '-c', str(self._change)], marshal_output=False)
+        # -- Only forget the changelist once it is no longer pending, a failed submit leaves it pending
+        self._connection._pending.discard(self._change)
 
     def delete(self):
         """Reverts all files in this changelist then deletes the changelist from perforce"""
@@ -647,6 +2056,74 @@ class Changelist(PerforceObject):
             pass
 
         self._connection.run(['change', '-d', str(self._change)])
+        self._connection._pending.discard(self._change)
+
+    def shelve(self, force=False):
+        """Shelves every file open in the changelist with a single ``shelve``, replacing any files already shelved
+
+        :param force: Overwrite shelved files that are locked or owned by another user
+        :type force: bool
+        :raises: :class:`.ShelveError`
+        """
+        if not self._change:
+            raise errors.ShelveError('Unabled to shelve files in the default changelist')
+
+        cmd = ['shelve', '-r', '-c', str(self._change)]
+        if force:
+            cmd.insert(1, '-f')
+
+        result = self._connection.run(cmd, partial=True)
+        if result.errors:
+            raise errors.ShelveError(result.errors[0]['data'].strip())
+
+    def unshelve(self, changelist=None, force=False):
+        """Unshelves the shelved files of this changelist into the connection client with a single ``unshelve``
+
+        :param changelist: Pending changelist to open the files in, defaults to the default changelist
+        :type changelist: :class:`.Changelist`
+        :param force: Overwrite writable files in the workspace
+        :type force: bool
+        :raises: :class:`.ShelveError`
+        :returns: :class:`UnshelveResult`
+        """
+        result = _unshelve(self._connection, self._change, changelist, force)
+        if result.errors:
+            raise errors.ShelveError(result.errors[0]['data'].strip())
+
+        return result
+
+    def unshelveInto(self, clients, force=False, workers=4):
+        """Unshelves the shelved files of this changelist into many clients at once, such as a set of build
+        workspaces.  Each client costs a single ``unshelve`` and up to ``workers`` run at the same time.  Failures
+        are collected per client rather than raised.
+
+        :param clients: Clients to unshelve into
+        :type clients: list<str or :class:`.Client`>
+        :param force: Overwrite writable files in the workspaces
+        :type force: bool
+        :param workers: Number of clients to unshelve into at the same time
+        :type workers: int
+        :returns: OrderedDict of client name to :class:`UnshelveResult`, in the order given
+        """
+        from multiprocessing.pool import ThreadPool
+
+        names = [six.text_type(c) for c in clients]
+        if not names:
+            return OrderedDict()
+
+        pool = ThreadPool(min(workers, len(names)))
+        try:
+            results = pool.map(
+                lambda name: _unshelve(self._connection.withClient(name), self._change, None, force), names)
+        finally:
+            pool.terminate()
+
+        for result in results:
+            if result.errors:
+                LOGGER.warn('Unable to unshelve {} into {}: {}'.format(
+                    self._change, result.client, result.errors[0]['data'].strip()))
+
+        return OrderedDict((r.client, r) for r in results)
 
     @property
     def change(self):
@@ -680,6 +2157,22 @@ class Changelist(PerforceObject):
     def user(self):
         return self._p4dict['user']
 
+    @property
+    def type(self):
+        """Changelist type, public or restricted"""
+        if 'type' not in self._p4dict:
+            self._loadSpec()
+
+        return self._p4dict.get('type')
+
+    @property
+    def jobs(self):
+        """Names of the jobs attached to this changelist"""
+        self._loadSpec()
+        keys = sorted((k for k in self._p4dict if re.match(r'jobs\d+$', k)), key=lambda k: int(k[4:]))
+
+        return [self._p4dict[k] for k in keys]
+
     @property
     def isDirty(self):
         """Does this changelist have unsaved changes"""
@@ -690,6 +2183,39 @@ class Changelist(PerforceObject):
         """Creation time of this changelist"""
         return datetime.datetime.strptime(self._p4dict['date'], DATE_FORMAT)
 
+    def _loadSpec(self):
+        """Queries the full spec once for changelists built from a record"""
+        if not self._partial:
+            return
+
+        spec = self._connection.run(['change', '-o', str(self._change)])[0]
+        for key, value in six.iteritems(spec):
+            self._p4dict.setdefault(camel_case(key), value)
+        self._partial = False
+
+    @staticmethod
+    def fromRecord(record, connection=None):
+        """Creates a changelist from a ``changes -l`` or ``describe`` record without querying the server.  The full
+        spec is only queried when :attr:`type` or :attr:`jobs` are not in the record and the files when they are
+        needed.
+
+        :param record: Record from ``changes -l`` or ``describe``, or fields from ``change -o``
+        :type record: dict
+        :param connection: Connection to use for the changelist
+        :type connection: :class:`.Connection`
+        :returns: :class:`.Changelist`
+        """
+        change = Changelist.__new__(Changelist)
+        PerforceObject.__init__(change, connection)
+        change._files = None
+        change._dirty = False
+        change._reverted = False
+        change._partial = True
+        change._change = int(record['change'])
+        change._p4dict = dict(record) if 'description' in record else change_fields(record)
+
+        return change
+
     @staticmethod
     def create(description='<Created by Python>', connection=None):
         """Creates a new changelist
@@ -704,8 +2230,10 @@ class Changelist(PerforceObject):
         description = description.replace('\n', '\n\t')
         form = NEW_FORMAT.format(client=str(connection.client), description=description)
         result = connection.run(['change', '-i'], stdin=form, marshal_output=False)
+        change = Changelist(int(result.split()[1]), connection)
+        connection._pending.update(change._p4dict)
 
-        return Changelist(int(result.split()[1]), connection)
+        return change
 
 
 class Default(Changelist):
@@ -754,7 +2282,7 @@ class Revision(PerforceObject):
 
     def __len__(self):
         if 'fileSize' not in self._p4dict:
-            self._p4dict = self._connection.run(['fstat', '-m', '1', '-Ol', self.depotFile])[0]
+            self._connection.fillDigests([self])
 
         return int(self._p4dict['fileSize'])
 
@@ -775,6 +2303,72 @@ class Revision(PerforceObject):
 
         self._filename = self.depotFile
 
+    def open(self):
+        """Opens the contents of this revision as a read-only binary file object streamed from ``p4 print``, only
+        a buffer of the file is held in memory at a time.  When the connection has a :attr:`~Connection.cache` the
+        revision is printed into it once and later calls open the cached file directly
+
+        :returns: :class:`io.BufferedReader`
+        """
+        key = self._cacheKey
+        if key is None:
+            return self._connection.runStream(['print', '-q', self._headSpec])
+
+        fh = self._connection.cache.open(key)
+        if fh is None:
+            with self._connection.runStream(['print', '-q', self._headSpec]) as stream:
+                self._connection.cache.put(key, stream)
+            fh = self._connection.cache.open(key)
+
+        return fh
+
+    def contents(self, chunksize=CHUNK_SIZE):
+        """Iterates over the contents of this revision in chunks, cached revisions are read from a memory map
+
+        :param chunksize: Maximum size of each chunk
+        :type chunksize: int
+        :returns: generator<bytes>
+        """
+        key = self._cacheKey
+        if key is not None:
+            if key not in self._connection.cache:
+                self.open().close()
+            data = self._connection.cache.map(key)
+            if data is not None:
+                try:
+                    for offset in range(0, len(data), chunksize):
+                        yield data[offset:offset + chunksize]
+                finally:
+                    if data:
+                        data.close()
+                return
+
+        with self.open() as fh:
+            for chunk in iter(lambda: fh.read(chunksize), b''):
+                yield chunk
+
+    def export(self, dest):
+        """Writes the contents of this revision straight to a local path with ``p4 print -o``, or copies it from
+        the connection cache
+
+        :param dest: Local path to write to
+        :type dest: str
+        :returns: :class:`path.path`
+        """
+        import path
+
+        key = self._cacheKey
+        fh = self._connection.cache.open(key) if key else None
+        if fh is None:
+            self._connection.run(['print', '-q', '-o', str(dest), self._headSpec], marshal_output=False)
+            if key:
+                self._connection.cache.put(key, dest)
+        else:
+            with fh, open(str(dest), 'wb') as output:
+                shutil.copyfileobj(fh, output)
+
+        return path.path(dest)
+
     def edit(self, changelist=0):
         """Checks out the file
 
@@ -926,18 +2520,43 @@ class Revision(PerforceObject):
     def hash(self):
         """The hash value of the current revision"""
         if 'digest' not in self._p4dict:
-            self._p4dict = self._connection.run(['fstat', '-m', '1', '-Ol', self.depotFile])[0]
+            self._connection.fillDigests([self])
 
         return self._p4dict['digest']
 
+    @property
+    def fields(self):
+        """Names of the fields currently loaded for this revision"""
+        return sorted(self._p4dict)
+
+    @property
+    def _cacheKey(self):
+        """The key of this revision in the connection cache, None if there is no cache or no revision"""
+        if self._connection.cache is None:
+            return None
+
+        return revcache.key(self._p4dict, self._connection._port)
+
+    @property
+    def _headSpec(self):
+        """The file spec for the head revision this object describes"""
+        if self._p4dict.get('headRev'):
+            return '{}#{}'.format(self._p4dict['depotFile'], self._p4dict['headRev'])
+
+        return self._p4dict['depotFile']
+
     @property
     def clientFile(self):
         """The local path to the revision"""
+        import path
+
         return path.path(self._p4dict['clientFile'])
 
     @property
     def depotFile(self):
         """The depot path to the revision"""
+        import path
+
         return path.path(self._p4dict['depotFile'])
 
     @property
@@ -1081,15 +2700,77 @@ class Client(FormObject):
 
         assert client is not None
 
-        results = self._connection.run(['client', '-o', client])[0]
+        results = self._connection.runCached(['client', '-o', client])[0]
         self._p4dict = {camel_case(k): v for k, v in six.iteritems(results)}
+        self._mapping = None
 
     def __unicode__(self):
         return self.client
 
+    def save(self):
+        """Saves the state of the client"""
+        super(Client, self).save()
+        self._mapping = None
+
+    def inView(self, filename):
+        """Determines locally, without a server call, if a file is under the client root and mapped by the view.
+        Paths with wildcards or revision specifiers are assumed to be mapped.
+
+        :param filename: Local, client or depot path
+        :type filename: str
+        :returns: bool
+        """
+        filename = six.text_type(filename).strip('"')
+        if RE_WILDCARD.search(filename) or '#' in filename or '@' in filename:
+            return True
+
+        clientprefix = '//{}/'.format(self.client)
+        if filename.startswith('//'):
+            side = 1 if filename.lower().startswith(clientprefix.lower()) else 0
+        else:
+            root = self._p4dict.get('root', 'null')
+            if root == 'null':
+                return True
+            try:
+                relative = os.path.relpath(os.path.abspath(filename), root)
+            except ValueError:
+                # -- Different drive
+                return False
+            if relative == os.pardir or relative.startswith(os.pardir + os.sep) or os.path.isabs(relative):
+                return False
+            filename = clientprefix + relative.replace(os.sep, '/')
+            side = 1
+
+        mapped = False
+        for exclude, patterns in self._viewMapping():
+            if patterns[side].match(filename):
+                mapped = not exclude
+
+        return mapped
+
+    def _viewMapping(self):
+        """The view as a list of (exclude, (depot regex, client regex)) in view order"""
+        if self._mapping is None:
+            flags = re.IGNORECASE if os.name == 'nt' else 0
+            keys = [k for k in self._p4dict if re.match('view\\d+$', k)]
+            self._mapping = []
+            for key in sorted(keys, key=lambda k: int(k[4:])):
+                tokens = [a or b for a, b in RE_VIEWLINE.findall(self._p4dict[key])]
+                if len(tokens) != 2:
+                    continue
+                depot, client = tokens
+                exclude = depot.startswith('-')
+                depot = depot.lstrip('-+')
+                client = client.lstrip('-+')
+                self._mapping.append((exclude, (view_regex(depot, flags), view_regex(client, flags))))
+
+        return self._mapping
+
     @property
     def root(self):
         """Root path fo the client"""
+        import path
+
         return path.Path(self._p4dict['root'])
 
     @property
@@ -1178,12 +2859,32 @@ class Stream(PerforceObject):
 
         assert stream is not None
 
-        results = self._connection.run(['stream', '-o', '-v', stream])[0]
+        results = self._connection.runCached(['stream', '-o', '-v', stream])[0]
         self._p4dict = {camel_case(k): v for k, v in six.iteritems(results)}
+        self._graph = None
 
     def __unicode__(self):
         return self._p4dict['stream']
 
+    @staticmethod
+    def fromRecord(record, connection=None, graph=None):
+        """Creates a stream from a ``stream -o`` record without querying the server
+
+        :param record: Stream spec fields
+        :type record: dict
+        :param connection: Connection to use for the stream
+        :type connection: :class:`.Connection`
+        :param graph: Graph the stream belongs to
+        :type graph: :class:`StreamGraph`
+        :returns: :class:`.Stream`
+        """
+        stream = Stream.__new__(Stream)
+        PerforceObject.__init__(stream, connection)
+        stream._p4dict = {camel_case(k): v for k, v in six.iteritems(record)}
+        stream._graph = graph
+
+        return stream
+
     @property
     def description(self):
         """Stream description tha thas been trimmed"""
@@ -1210,3 +2911,155 @@ class Stream(PerforceObject):
     def update(self):
         """The date and time the client was updated"""
         return datetime.datetime.strptime(self._p4dict['update'], DATE_FORMAT)
+
+    @property
+    def type(self):
+        """The stream type, such as mainline or development"""
+        return self._p4dict.get('type')
+
+    @property
+    def parent(self):
+        """The parent :class:`Stream`, None for mainline streams"""
+        parent = self._p4dict.get('parent', 'none')
+        if parent == 'none':
+            return None
+
+        if self._graph is not None and parent in self._graph:
+            return self._graph[parent]
+
+        return Stream(parent, self._connection)
+
+    @property
+    def children(self):
+        """Child streams in the graph this stream was loaded with"""
+        if self._graph is None:
+            return []
+
+        return self._graph.children(self)
+
+    @property
+    def paths(self):
+        """List of (type, view path, depot path) for the Paths field, the depot path is None when not given"""
+        entries = []
+        for line in self._fields('paths'):
+            words = [a or b for a, b in RE_VIEWLINE.findall(line)]
+            if len(words) >= 2:
+                entries.append((words[0], words[1], words[2] if len(words) > 2 else None))
+
+        return entries
+
+    @property
+    def remapped(self):
+        """List of (view path, client path) for the Remapped field"""
+        return [tuple(a or b for a, b in RE_VIEWLINE.findall(line))[:2] for line in self._fields('remapped')]
+
+    @property
+    def ignored(self):
+        """List of ignored paths and extensions"""
+        return [line.strip() for line in self._fields('ignored')]
+
+    @property
+    def resolvedView(self):
+        """The view of the stream resolved locally from its paths and the paths of its parents, as a list of
+        :data:`FileSpec` with the depot path and the view path.  The results are cached on the connection until any
+        stream in the chain is updated.  The server view from :attr:`view` remains authoritative for unusual specs.
+        """
+        graph = self._graph
+        if graph is None:
+            chain = [self]
+            while chain[-1].parent is not None:
+                chain.append(chain[-1].parent)
+            graph = StreamGraph(self._connection, chain)
+
+        return graph.resolve(self._p4dict['stream'])
+
+    def _fields(self, name):
+        """Values of a numbered list field in order"""
+        keys = [k for k in self._p4dict if k.startswith(name) and k[len(name):].isdigit()]
+
+        return [self._p4dict[k] for k in sorted(keys, key=lambda k: int(k[len(name):]))]
+
+
+class StreamGraph(object):
+    """The parent and child relations of a set of streams, see :meth:`Connection.streams`.  Streams are ordered by
+    name and iterate depth first from the mainlines.
+    """
+    def __init__(self, connection, streams):
+        self._connection = connection
+        self._streams = OrderedDict()
+        for stream in sorted(streams, key=six.text_type):
+            stream._graph = self
+            self._streams[stream._p4dict['stream']] = stream
+
+        self._children = dict((name, []) for name in self._streams)
+        for name, stream in six.iteritems(self._streams):
+            parent = stream._p4dict.get('parent')
+            if parent in self._children:
+                self._children[parent].append(stream)
+
+    def __repr__(self):
+        return '<{}: {} streams>'.format(self.__class__.__name__, len(self))
+
+    def __len__(self):
+        return len(self._streams)
+
+    def __contains__(self, name):
+        return six.text_type(name) in self._streams
+
+    def __getitem__(self, name):
+        return self._streams[six.text_type(name)]
+
+    def __iter__(self):
+        return self.walk()
+
+    @property
+    def roots(self):
+        """Streams without a parent in the graph"""
+        return [s for s in self._streams.values() if s._p4dict.get('parent') not in self._streams]
+
+    def children(self, stream):
+        """Child streams of a stream
+
+        :param stream: Stream or stream name
+        :type stream: str
+        :returns: list<:class:`Stream`>
+        """
+        return list(self._children.get(six.text_type(stream), []))
+
+    def walk(self, stream=None):
+        """Yields a stream and all of its descendants depth first, all streams when not given
+
+        :param stream: Stream or stream name to start from
+        :type stream: str
+        :returns: generator<:class:`Stream`>
+        """
+        stack = list(reversed(self.roots if stream is None else [self[stream]]))
+        while stack:
+            current = stack.pop()
+            yield current
+            stack.extend(reversed(self._children[current._p4dict['stream']]))
+
+    def resolve(self, stream):
+        """Resolves the view of a stream locally, see :attr:`Stream.resolvedView`
+
+        :param stream: Stream or stream name
+        :type stream: str
+        :returns: list<:data:`FileSpec`>
+        """
+        chain = [self[stream]]
+        while chain[-1]._p4dict.get('parent') in self._streams:
+            chain.append(self[chain[-1]._p4dict['parent']])
+
+        key = tuple((s._p4dict['stream'], s._p4dict.get('update')) for s in chain)
+        view = self._connection._streamViews.get(key)
+        if view is None:
+            entries = None
+            for current in reversed(chain):
+                entries = resolve_paths(current, entries)
+            ignored = []
+            for current in reversed(chain):
+                ignored += [i for i in current.ignored if i not in ignored]
+            view = view_lines(chain[0], entries, ignored)
+            self._connection._streamViews[key] = view
+
+        return list(view)
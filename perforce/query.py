@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+"""
+perforce.query
+~~~~~~~~~~~~~~
+
+This module implements a predicate builder that compiles to server side ``fstat`` filters
+
+::
+
+    >>> from perforce.query import Q
+    >>> q = (Q(headType__contains='binary') & Q(headChange__gt=1000)).limit(50)
+    >>> q.compile()
+    (['-m', '50'], 'headType=*binary* & headChange>1000')
+    >>> p4.ls('//depot/...', query=q)
+
+:copyright: (c) 2015 by Brett Dixon
+:license: MIT, see LICENSE for more details
+"""
+
+import re
+
+import six
+
+
+#: Characters that have a meaning in filter expressions and are escaped in values
+SPECIAL_CHARACTERS = '\\*|&^()=<> \t'
+#: Comparison lookups and their operator
+OPERATORS = {
+    'exact': '=',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+}
+#: Operators of negated comparisons
+NEGATED = {
+    '>': '<=',
+    '>=': '<',
+    '<': '>=',
+    '<=': '>',
+}
+#: Scope fields and the fstat flag they compile to when given at the top level
+SCOPES = {
+    'opened': '-Ro',
+    'have': '-Rh',
+    'mapped': '-Rc',
+}
+#: Filter expression used for a scope that is combined with other terms
+SCOPE_FIELDS = {
+    'opened': 'action',
+    'have': 'haveRev',
+}
+
+RE_FIELD = re.compile(r'^[A-Za-z][\w]*$')
+
+
+def escape(value):
+    """Escapes a value for a filter expression
+
+    :param value: Value to escape
+    :type value: str
+    :returns: str
+    """
+    value = six.text_type(value)
+
+    return ''.join('\\' + c if c in SPECIAL_CHARACTERS else c for c in value)
+
+
+class Q(object):
+    """A predicate on fstat fields.  Keyword arguments are ``field__lookup=value`` terms combined with AND, where
+    lookup is one of exact (the default), ne, gt, gte, lt, lte, contains, startswith, endswith, exists or in.
+    Predicates combine with ``&``, ``|`` and ``~``.
+
+    The special terms ``opened=True``, ``have=True`` and ``mapped=True`` compile to the ``-Ro``, ``-Rh`` and
+    ``-Rc`` scopes and ``change=N`` to ``-e N`` when they are combined with AND at the top level.  :meth:`limit`
+    compiles to ``-m``.
+    """
+    AND = '&'
+    OR = '|'
+
+    def __init__(self, **lookups):
+        self.children = []
+        for key in sorted(lookups):
+            field, _, lookup = key.partition('__')
+            self.children.append(self._term(field, lookup or 'exact', lookups[key]))
+        self.connector = self.AND
+        self.negated = False
+        self.count = None
+
+    def __repr__(self):
+        flags, expression = self.compile()
+
+        return '<{}: {}>'.format(self.__class__.__name__, ' '.join(flags + [expression]).strip())
+
+    def __and__(self, other):
+        return self._combine(other, self.AND)
+
+    def __or__(self, other):
+        return self._combine(other, self.OR)
+
+    def __invert__(self):
+        q = self._copy()
+        q.negated = not self.negated
+
+        return q
+
+    def limit(self, count):
+        """Limits the number of records returned
+
+        :param count: Maximum number of records
+        :type count: int
+        :returns: :class:`Q`
+        """
+        q = self._copy()
+        q.count = int(count)
+
+        return q
+
+    def compile(self):
+        """Compiles to fstat flags and a filter expression for ``-F``
+
+        :raises: ValueError for terms that cannot be expressed
+        :returns: tuple(list, str)
+        """
+        flags = []
+        children = self.children
+        if self.connector == self.AND and not self.negated:
+            children = []
+            for child in self.children:
+                if isinstance(child, tuple) and child[0] in SCOPES and child[1] == 'exact' and child[2]:
+                    if SCOPES[child[0]] not in flags:
+                        flags.append(SCOPES[child[0]])
+                elif isinstance(child, tuple) and child[0] == 'change' and child[1] == 'exact' and \
+                        '-e' not in flags:
+                    flags += ['-e', str(int(child[2]))]
+                else:
+                    children.append(child)
+
+        if self.count is not None:
+            flags += ['-m', str(self.count)]
+
+        node = self._copy()
+        node.children = children
+
+        return flags, node._expression(False)
+
+    def _expression(self, negated):
+        """Renders the filter expression, pushing negation down to the terms"""
+        negated = negated != self.negated
+        connector = self.connector
+        if negated:
+            connector = self.OR if connector == self.AND else self.AND
+
+        parts = []
+        for child in self.children:
+            if isinstance(child, Q):
+                expression = child._expression(negated)
+                if expression and len(child.children) > 1 and child._connector(negated) != connector:
+                    expression = '({})'.format(expression)
+            else:
+                expression = self._render(child, negated)
+            if expression:
+                parts.append(expression)
+
+        return ' {} '.format(connector).join(parts)
+
+    def _connector(self, negated):
+        """The connector used when rendered with an outer negation"""
+        if negated != self.negated:
+            return self.OR if self.connector == self.AND else self.AND
+
+        return self.connector
+
+    def _render(self, term, negated):
+        """Renders a single term"""
+        field, lookup, value = term
+        if field in SCOPES or field == 'change':
+            if field not in SCOPE_FIELDS:
+                raise ValueError('{} can only be combined with AND at the top level'.format(field))
+            field, lookup, value = SCOPE_FIELDS[field], 'exists', bool(value)
+
+        if lookup == 'in':
+            terms = [Q._term(field, 'exact', v) for v in value]
+            if not terms:
+                raise ValueError('{}__in needs at least one value'.format(field))
+            joined = (' & ' if negated else ' | ').join(self._render(t, negated) for t in terms)
+
+            return '({})'.format(joined) if len(terms) > 1 else joined
+
+        if lookup == 'ne':
+            lookup, negated = 'exact', not negated
+        if lookup == 'exists':
+            lookup, value, negated = 'exact', None, negated != (not value)
+
+        if lookup in ('contains', 'startswith', 'endswith'):
+            pattern = {'contains': '*{}*', 'startswith': '{}*', 'endswith': '*{}'}[lookup]
+            expression = '{}={}'.format(field, pattern.format(escape(value)))
+        elif value is None:
+            expression = '{}=*'.format(field)
+        else:
+            operator = OPERATORS[lookup]
+            if negated and operator in NEGATED:
+                return '{}{}{}'.format(field, NEGATED[operator], escape(value))
+            expression = '{}{}{}'.format(field, operator, escape(value))
+
+        return '^' + expression if negated else expression
+
+    def _combine(self, other, connector):
+        """Combines two predicates"""
+        if not isinstance(other, Q):
+            raise TypeError('{} can only be combined with another Q'.format(type(other)))
+
+        q = Q()
+        q.connector = connector
+        for node in (self, other):
+            if node.connector == connector and not node.negated and node.count is None:
+                q.children += node.children
+            else:
+                child = node._copy()
+                child.count = None
+                q.children.append(child)
+        counts = [n.count for n in (self, other) if n.count is not None]
+        q.count = min(counts) if counts else None
+
+        return q
+
+    def _copy(self):
+        """Shallow copy of the predicate"""
+        q = Q()
+        q.children = list(self.children)
+        q.connector = self.connector
+        q.negated = self.negated
+        q.count = self.count
+
+        return q
+
+    @staticmethod
+    def _term(field, lookup, value):
+        """Validates a single term"""
+        if not RE_FIELD.match(field):
+            raise ValueError('Invalid field name: {}'.format(field))
+        if lookup not in OPERATORS and lookup not in ('ne', 'contains', 'startswith', 'endswith', 'exists', 'in'):
+            raise ValueError('Unknown lookup: {}'.format(lookup))
+
+        return (field, lookup, value)
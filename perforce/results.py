@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+perforce.results
+~~~~~~~~~~~~~~~~
+
+This module implements a list of command records that spills to a temporary file past a memory budget, see
+:meth:`.Connection.run`
+
+:copyright: (c) 2015 by Brett Dixon
+:license: MIT, see LICENSE for more details
+"""
+
+import array
+import marshal
+import tempfile
+import threading
+
+from .columns import INT_TYPECODE
+
+
+#: Default bytes of records kept in memory before spilling to disk
+SPILL_SIZE = 64 * 1024 * 1024
+#: Bytes read from the spill file at a time while iterating
+READ_SIZE = 1024 * 1024
+
+
+class ResultSet(object):
+    """A sequence of records that keeps the first ``budget`` bytes of records in memory, measured by
+    their marshaled size, and appends the rest to a temporary file.  Records on disk are stored marshaled with an
+    array of end offsets, so length and indexing do not read the file and iterating reads it in large blocks.  A
+    result set can be iterated any number of times until it is closed, which removes the file.
+
+    ::
+
+        >>> records = p4.run(['fstat', '//depot/...'], budget=16 * 1024 * 1024)
+        >>> len(records), records[-1]['depotFile']
+
+    :param records: Records to add
+    :type records: iterable
+    :param budget: Bytes of records to keep in memory
+    :type budget: int
+    """
+    def __init__(self, records=(), budget=SPILL_SIZE):
+        self._budget = budget
+        self._size = 0
+        self._memory = []
+        self._file = None
+        self._offsets = array.array(INT_TYPECODE)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.extend(records)
+
+    def __repr__(self):
+        if self._closed:
+            return '<{}: closed>'.format(self.__class__.__name__)
+
+        return '<{}: {} records, {} on disk>'.format(self.__class__.__name__, len(self), len(self._offsets))
+
+    def __len__(self):
+        self._check()
+
+        return len(self._memory) + len(self._offsets)
+
+    def __nonzero__(self):
+        return len(self) > 0
+
+    __bool__ = __nonzero__
+
+    def __iter__(self):
+        self._check()
+        for record in self._memory:
+            yield record
+
+        for record in self._iterFile():
+            yield record
+
+    def __getitem__(self, index):
+        self._check()
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('ResultSet index out of range')
+
+        if index < len(self._memory):
+            return self._memory[index]
+
+        index -= len(self._memory)
+        start = self._offsets[index - 1] if index else 0
+
+        return marshal.loads(self._read(start, self._offsets[index] - start))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    @property
+    def spilled(self):
+        """Have records been written to disk"""
+        return self._file is not None
+
+    def append(self, record):
+        """Adds a record
+
+        :param record: Record to add
+        :type record: dict
+        """
+        self._check()
+        if self._file is None:
+            if self._size < self._budget:
+                self._size += len(marshal.dumps(record))
+                self._memory.append(record)
+                return
+            self._file = tempfile.TemporaryFile(prefix='p4results')
+
+        data = marshal.dumps(record)
+        with self._lock:
+            start = self._offsets[-1] if self._offsets else 0
+            self._file.seek(start)
+            self._file.write(data)
+            self._offsets.append(start + len(data))
+
+    def extend(self, records):
+        """Adds many records
+
+        :param records: Records to add
+        :type records: iterable
+        """
+        for record in records:
+            self.append(record)
+
+    @property
+    def closed(self):
+        """Has the result set been closed"""
+        return self._closed
+
+    def close(self):
+        """Removes the spill file and releases the records, the result set cannot be used afterwards"""
+        self._closed = True
+        self._memory = []
+        self._offsets = array.array(INT_TYPECODE)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _check(self):
+        """Raises if the result set was closed"""
+        if self._closed:
+            raise ValueError('I/O operation on closed ResultSet')
+
+    def _read(self, start, size):
+        """Reads bytes from the spill file"""
+        with self._lock:
+            self._file.seek(start)
+
+            return self._file.read(size)
+
+    def _iterFile(self):
+        """Yields the records on disk, reading many at a time"""
+        index, count = 0, len(self._offsets)
+        while index < count:
+            start = self._offsets[index - 1] if index else 0
+            end = index
+            while end + 1 < count and self._offsets[end + 1] - start <= READ_SIZE:
+                end += 1
+            data = self._read(start, self._offsets[end] - start)
+            for i in range(index, end + 1):
+                first = (self._offsets[i - 1] if i else 0) - start
+                yield marshal.loads(data[first:self._offsets[i] - start])
+            index = end + 1
@@ -0,0 +1,606 @@
+# -*- coding: utf-8 -*-
+
+"""
+perforce.workspace
+~~~~~~~~~~~~~~~~~~
+
+This module implements tools that compare a client workspace on disk with the depot
+
+:copyright: (c) 2015 by Brett Dixon
+:license: MIT, see LICENSE for more details
+"""
+
+import os
+import sys
+import stat
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import threading
+import multiprocessing
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from .api import connect, edit, delete
+from .models import Changelist, log_errors, change_args
+
+
+LOGGER = logging.getLogger(__name__)
+#: Size of each read when hashing local files
+BLOCK_SIZE = 1024 * 1024
+
+#: File types that are stored with LF line endings
+TEXT_TYPES = ('text', 'xtext', 'unicode', 'xunicode', 'utf8')
+#: File types whose local content cannot be compared to the depot digest
+UNHASHABLE_TYPES = ('ktext', 'kxtext', 'utf16', 'symlink')
+#: Fields needed from fstat to compare local files
+FIELDS = 'clientFile,depotFile,headType,headModTime,fileSize,digest,action,haveRev'
+
+#: Results of :func:`verify`
+VerifyResult = namedtuple('VerifyResult', 'matched, mismatched, missing, extra, skipped')
+#: Results of :func:`reconcile`, local paths to open for each action
+ReconcileResult = namedtuple('ReconcileResult', 'edit, add, delete')
+
+# -- inotify constants from sys/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | \
+    IN_DELETE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+EVENT = struct.Struct('iIII')
+
+try:
+    scandir = os.scandir
+except AttributeError:
+    scandir = None
+
+
+def digest(filename, crlf=False, blocksize=BLOCK_SIZE):
+    """Computes the perforce digest (upper case MD5) of a local file reading it in blocks, so memory stays bounded
+    for files of any size
+
+    :param filename: Local path of the file
+    :type filename: str
+    :param crlf: Convert CRLF line endings to LF before hashing, as the server stores text files
+    :type crlf: bool
+    :param blocksize: Number of bytes to read at a time
+    :type blocksize: int
+    :returns: str
+    """
+    md5 = hashlib.md5()
+    carry = b''
+    with open(filename, 'rb') as fh:
+        while True:
+            block = fh.read(blocksize)
+            if not block:
+                break
+            if crlf:
+                block = carry + block
+                carry = b''
+                if block.endswith(b'\r'):
+                    # -- The matching \n may be in the next block
+                    block, carry = block[:-1], b'\r'
+                block = block.replace(b'\r\n', b'\n')
+            md5.update(block)
+
+    md5.update(carry)
+
+    return md5.hexdigest().upper()
+
+
+def compare(fields, filename, crlf=False, filestat=None, modtime=False):
+    """Compares a local file with the fstat fields of the revision it should be, the size and optionally the
+    modification time are checked first and the digest only when they cannot decide.
+
+    :param fields: fstat fields including ``digest`` and ``fileSize``
+    :type fields: dict
+    :param filename: Local path of the file
+    :type filename: str
+    :param crlf: The workspace uses CRLF line endings for text files
+    :type crlf: bool
+    :param filestat: ``(size, mtime)`` of the local file if already known
+    :type filestat: tuple
+    :param modtime: Treat a file with the same size and modification time as the revision as unchanged
+    :type modtime: bool
+    :returns: True if the file matches, False if it does not and None if it is missing
+    """
+    convert = crlf and fields.get('headType', '').startswith(TEXT_TYPES)
+    try:
+        if filestat is None:
+            info = os.stat(filename)
+            filestat = (info.st_size, info.st_mtime)
+
+        if not convert:
+            if filestat[0] != int(fields.get('fileSize', -1)):
+                return False
+            if modtime and int(filestat[1]) == int(fields.get('headModTime', -1)):
+                return True
+
+        return digest(filename, convert) == fields.get('digest')
+    except (IOError, OSError):
+        return None
+
+
+def verify(files, connection=None, workers=None):
+    """Verifies that the files synced to the workspace match the depot byte for byte.
+
+    Depot digests of the have revisions are fetched with a single ``fstat -Ol`` and the local files are hashed by a
+    pool of threads.  Files open in the workspace and file types that are modified on sync (keyword expansion,
+    utf16) are skipped.  When a filespec ending in ``...`` is given, files on disk under it that are not in the have
+    list are reported as extra.
+
+    :param files: Filespec or list of :class:`.Revision` objects to verify
+    :type files: str
+    :param connection: Connection object to use
+    :type connection: :py:class:`Connection`
+    :param workers: Number of files to hash at the same time, defaults to the number of CPUs
+    :type workers: int
+    :returns: :class:`VerifyResult` of revision lists, and local paths for extra
+    """
+    c = connection or connect()
+
+    if isinstance(files, six.string_types):
+        revisions = c.ls(files.split('#')[0] + '#have', digests=True)
+        expected = dict((id(r), r._p4dict) for r in revisions)
+    else:
+        revisions = list(files)
+        expected = dict((id(r), r._p4dict) for r in revisions)
+        specs = ['{}#{}'.format(r.depotFile, r.revision) for r in revisions
+                 if r.revision > 0 and (r.revision != r.head.revision or 'digest' not in r._p4dict)]
+        if specs:
+            records = dict((r['depotFile'], r) for r in c.runArgs(['fstat', '-Ol'], specs, partial=True).records)
+            for rev in revisions:
+                if rev.depotFile in records:
+                    expected[id(rev)] = dict(rev._p4dict, **records[rev.depotFile])
+
+    crlf = _crlf(c.client)
+
+    matched, mismatched, missing, skipped, tocheck = [], [], [], [], []
+    for rev in revisions:
+        fields = expected[id(rev)]
+        filetype = fields.get('headType', '')
+        if rev.revision <= 0 or 'clientFile' not in fields:
+            continue
+        if rev.action or 'digest' not in fields or filetype.startswith(UNHASHABLE_TYPES) or '+k' in filetype:
+            skipped.append(rev)
+        else:
+            tocheck.append((rev, fields))
+
+    def check(item):
+        rev, fields = item
+        return rev, compare(fields, fields['clientFile'], crlf)
+
+    LOGGER.debug('Verifying {} files, skipped {}'.format(len(tocheck), len(skipped)))
+    pool = ThreadPool(workers or multiprocessing.cpu_count())
+    try:
+        for rev, result in pool.imap_unordered(check, tocheck, chunksize=16):
+            if result is None:
+                missing.append(rev)
+            elif result:
+                matched.append(rev)
+            else:
+                mismatched.append(rev)
+    finally:
+        pool.terminate()
+
+    extra = []
+    if isinstance(files, six.string_types) and files.split('#')[0].endswith('...'):
+        tracked = set(os.path.normcase(r._p4dict['clientFile']) for r in revisions if 'clientFile' in r._p4dict)
+        for record in c.run(['where', files.split('#')[0]]):
+            root = os.path.dirname(record.get('path', ''))
+            if record.get('unmap') or not root:
+                continue
+            for dirpath, dirnames, filenames in os.walk(root):
+                for name in filenames:
+                    filename = os.path.join(dirpath, name)
+                    if os.path.normcase(filename) not in tracked:
+                        extra.append(filename)
+
+    return VerifyResult(matched, mismatched, missing, sorted(extra), skipped)
+
+
+def reconcile(path=None, connection=None, changelist=None, dryrun=False, workers=None):
+    """Finds the files that were modified, added or deleted in the workspace without the server scanning it, then
+    opens them with at most one ``edit``, one ``add`` and one ``delete``.
+
+    The directory is walked with a pool of threads and compared with the have list from a single ``fstat``.  Files
+    are compared by size and modification time first and by digest only when those do not match.  File types that
+    cannot be hashed locally are checked with a single ``diff -se``.  Untracked files are only added when they are
+    mapped by the client view.  Files already open are left alone.
+
+    :param path: Local directory to reconcile, defaults to the client root
+    :type path: str
+    :param connection: Connection object to use
+    :type connection: :py:class:`Connection`
+    :param changelist: Optional changelist to open the files into
+    :type changelist: :class:`.Changelist`
+    :param dryrun: Only report what would be opened
+    :type dryrun: bool
+    :param workers: Number of threads used to walk and hash, defaults to the number of CPUs
+    :type workers: int
+    :returns: :class:`ReconcileResult`
+    """
+    c = connection or connect()
+    root = os.path.abspath(path or c.client.root)
+    spec = os.path.join(root, '...')
+
+    have = _records(c.iterRun(['fstat', '-Ol', '-T', FIELDS, spec + '#have']))
+    opened = _records(c.iterRun(['fstat', '-Ro', '-T', 'clientFile', spec]))
+
+    pool = ThreadPool(workers or multiprocessing.cpu_count())
+    try:
+        result = _classify(c, _walk(root, pool), have, opened, pool)
+    finally:
+        pool.terminate()
+
+    if not dryrun:
+        _apply(c, result, changelist)
+
+    return result
+
+
+def _records(records):
+    """Indexes fstat records by their normalized local path"""
+    indexed = {}
+    for record in records:
+        if record.get('code') != 'error' and 'clientFile' in record:
+            indexed[os.path.normcase(record['clientFile'])] = record
+
+    return indexed
+
+
+def _classify(connection, files, have, opened, pool):
+    """Compares local files with the have list and finds what needs to be opened for edit, add or delete
+
+    :param files: ``(path, size, mtime)`` of the local files that exist
+    :param have: Have list fstat records by normalized local path
+    :param opened: Opened files by normalized local path, these are ignored
+    :returns: :class:`ReconcileResult`
+    """
+    client = connection.client
+    crlf = _crlf(client)
+    edit, add, tocompare, serverdiff = [], [], [], []
+    seen = set()
+    for filename, size, mtime in files:
+        key = os.path.normcase(filename)
+        seen.add(key)
+        if key in opened:
+            continue
+
+        fields = have.get(key)
+        if fields is None:
+            if client.inView(filename):
+                add.append(filename)
+        elif 'digest' not in fields or fields.get('headType', '').startswith(UNHASHABLE_TYPES) or \
+                '+k' in fields.get('headType', ''):
+            serverdiff.append(filename)
+        else:
+            tocompare.append((fields, filename, size, mtime))
+
+    def check(item):
+        fields, filename, size, mtime = item
+        return filename, compare(fields, filename, crlf, (size, mtime), modtime=True)
+
+    delete = [f['clientFile'] for k, f in six.iteritems(have) if k not in seen and k not in opened]
+    for filename, result in pool.imap_unordered(check, tocompare, chunksize=16):
+        if result is None:
+            delete.append(filename)
+        elif not result:
+            edit.append(filename)
+
+    if serverdiff:
+        for record in connection.runArgs(['diff', '-se'], serverdiff, partial=True).records:
+            if 'clientFile' in record:
+                edit.append(record['clientFile'])
+
+    result = ReconcileResult(sorted(edit), sorted(add), sorted(delete))
+    LOGGER.debug('Reconcile found {} edits, {} adds and {} deletes'.format(*[len(r) for r in result]))
+
+    return result
+
+
+def _apply(connection, result, changelist=None):
+    """Opens the files of a :class:`ReconcileResult` with one command per action"""
+    cmd = change_args(changelist)
+    for action, files in zip(ReconcileResult._fields, result):
+        if files:
+            log_errors(connection.runArgs([action] + cmd, files, partial=True), 'Unable to ' + action + ': {}')
+
+    if isinstance(changelist, Changelist):
+        # -- Files will be queried again when needed
+        changelist._files = None
+
+
+def _crlf(client):
+    """Does the client write text files with CRLF line endings"""
+    lineend = client.lineEnd if client is not None else 'local'
+
+    return lineend == 'win' or (lineend == 'local' and os.name == 'nt')
+
+
+def _walk(root, pool):
+    """Lists ``(path, size, mtime)`` of every file under root, scanning one directory per task on the pool"""
+    pending = [pool.apply_async(_scan, (root,))]
+    while pending:
+        files, dirs = pending.pop().get()
+        for entry in files:
+            yield entry
+        pending.extend(pool.apply_async(_scan, (d,)) for d in dirs)
+
+
+def _scan(directory):
+    """Lists the files and sub directories of a single directory"""
+    files, dirs = [], []
+    try:
+        if scandir is not None:
+            for entry in scandir(directory):
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                else:
+                    info = entry.stat(follow_symlinks=False)
+                    files.append((entry.path, info.st_size, info.st_mtime))
+        else:
+            for name in os.listdir(directory):
+                filename = os.path.join(directory, name)
+                info = os.lstat(filename)
+                if stat.S_ISDIR(info.st_mode):
+                    dirs.append(filename)
+                else:
+                    files.append((filename, info.st_size, info.st_mtime))
+    except (IOError, OSError) as err:
+        LOGGER.debug(err)
+
+    return files, dirs
+
+
+class Tracker(object):
+    """Watches a workspace with inotify and remembers which paths were touched, so finding what changed since the
+    last sync or submit only looks at those paths instead of scanning the whole tree.
+
+    Directories that are created, moved or deleted, directories that could not be watched and the whole root after
+    an event queue overflow are rescanned with :func:`reconcile`.  Only available on Linux, other platforms raise
+    :class:`OSError`.
+
+    ::
+
+        >>> tracker = Tracker(connection=p4)
+        >>> tracker.start()
+        >>> tracker.candidates()
+        ReconcileResult(edit=['/ws/foo.txt'], add=[], delete=[])
+        >>> tracker.open(changelist)
+    """
+    def __init__(self, path=None, connection=None):
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+
+        self._connection = connection
+        self._root = os.path.abspath(path or (connection or connect()).client.root)
+        self._lock = threading.Lock()
+        self._touched = {}
+        self._rescan = {}
+        self._unwatched = set()
+        self._watches = {}
+        self._counter = 0
+        self._fd = None
+        self._thread = None
+        self._running = False
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+    def __repr__(self):
+        return '<Tracker: {}>'.format(self._root)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+    @property
+    def root(self):
+        """The directory being watched"""
+        return self._root
+
+    @property
+    def touched(self):
+        """Paths of files touched since the last reset"""
+        with self._lock:
+            return set(self._touched)
+
+    def start(self):
+        """Starts watching the workspace"""
+        if self._running:
+            return
+
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+        self._watch(self._root)
+        self._running = True
+        self._thread = threading.Thread(target=self._read, name=repr(self))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops watching the workspace, touched paths are kept"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._watches = {}
+
+    def reset(self):
+        """Forgets every touched path, call after syncing or submitting"""
+        with self._lock:
+            self._touched = {}
+            self._rescan = {}
+
+    def candidates(self, workers=None):
+        """Finds the touched files that need to be opened for edit, add or delete
+
+        :param workers: Number of threads used to hash and rescan
+        :type workers: int
+        :returns: :class:`ReconcileResult`
+        """
+        return self._candidates(workers)[0]
+
+    def open(self, changelist=None, workers=None):
+        """Opens the candidates with :func:`.api.edit`, :meth:`.Connection.add` and :func:`.api.delete`, each
+        running a single command for all of its files, then forgets the paths that were handled
+
+        :param changelist: Optional changelist to open the files into
+        :type changelist: :class:`.Changelist`
+        :param workers: Number of threads used to hash and rescan
+        :type workers: int
+        :returns: :class:`ReconcileResult`
+        """
+        result, touched, rescan = self._candidates(workers)
+        c = self._connection or connect()
+        if result.edit:
+            edit(result.edit, c, changelist)
+        if result.add:
+            c.add(result.add, changelist)
+        if result.delete:
+            delete(result.delete, c, changelist)
+
+        with self._lock:
+            for pending, snapshot in ((self._touched, touched), (self._rescan, rescan)):
+                for key, counter in six.iteritems(snapshot):
+                    if pending.get(key) == counter:
+                        del pending[key]
+
+        return result
+
+    def _candidates(self, workers):
+        """Classifies a snapshot of the touched paths"""
+        c = self._connection or connect()
+        with self._lock:
+            touched = dict(self._touched)
+            rescan = dict(self._rescan)
+            directories = set(rescan) | self._unwatched
+        if self._root in directories:
+            directories = set([self._root])
+
+        def covered(filename):
+            return any(filename.startswith(d + os.sep) for d in directories)
+
+        files = sorted(f for f in touched if not covered(f))
+        results = []
+        pool = ThreadPool(workers or multiprocessing.cpu_count())
+        try:
+            if files:
+                have = _records(c.runArgs(['fstat', '-Ol', '-T', FIELDS], [f + '#have' for f in files],
+                                          partial=True).records)
+                opened = _records(c.runArgs(['fstat', '-Ro', '-T', 'clientFile'], files, partial=True).records)
+                entries = []
+                for filename in files:
+                    try:
+                        info = os.lstat(filename)
+                    except OSError:
+                        continue
+                    if not stat.S_ISDIR(info.st_mode):
+                        entries.append((filename, info.st_size, info.st_mtime))
+                results.append(_classify(c, entries, have, opened, pool))
+        finally:
+            pool.terminate()
+
+        for directory in sorted(directories):
+            if not any(directory.startswith(d + os.sep) for d in directories):
+                results.append(reconcile(directory, c, dryrun=True, workers=workers))
+
+        merged = ReconcileResult(*[sorted(set(sum(lists, []))) for lists in zip(*results)]) if results else \
+            ReconcileResult([], [], [])
+
+        return merged, touched, rescan
+
+    def _watch(self, directory):
+        """Adds watches for a directory tree"""
+        for dirpath, dirnames, filenames in os.walk(directory):
+            wd = self._libc.inotify_add_watch(self._fd, dirpath.encode(sys.getfilesystemencoding()), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOENT:
+                    continue
+                LOGGER.warn('Unable to watch {}, it will be rescanned: {}'.format(dirpath, os.strerror(err)))
+                with self._lock:
+                    self._unwatched.add(dirpath)
+                del dirnames[:]
+                continue
+            self._watches[wd] = dirpath
+
+    def _touch(self, pending, key):
+        self._counter += 1
+        pending[key] = self._counter
+
+    def _read(self):
+        """Reads events until stopped"""
+        while self._running:
+            ready, _, _ = select.select([self._fd], [], [], 0.5)
+            if not ready:
+                continue
+
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except OSError as err:
+                if err.errno == errno.EAGAIN:
+                    continue
+                raise
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+                name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+                offset += EVENT.size + length
+                self._event(wd, mask, name.decode(sys.getfilesystemencoding(), 'replace'))
+
+    def _event(self, wd, mask, name):
+        """Handles a single inotify event"""
+        if mask & IN_Q_OVERFLOW:
+            LOGGER.warn('inotify queue overflowed, {} will be rescanned'.format(self._root))
+            with self._lock:
+                self._touch(self._rescan, self._root)
+            return
+
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+
+        directory = self._watches.get(wd)
+        if directory is None:
+            return
+
+        filename = os.path.join(directory, name) if name else directory
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch(filename)
+            with self._lock:
+                self._touch(self._rescan, filename)
+        elif mask & IN_DELETE_SELF:
+            with self._lock:
+                self._touch(self._rescan, directory)
+        else:
+            with self._lock:
+                self._touch(self._touched, filename)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_cache
+----------------------------------
+
+Tests for `perforce.cache` module.
+"""
+
+import io
+import os
+import time
+
+from perforce import Connection
+from perforce.cache import RevisionCache, key
+
+P4PORT = 'DESKTOP-M97HMBQ:1666'
+P4USER = 'p4test'
+P4CLIENT = 'p4_unit_tests'
+
+
+def test_key():
+    record = {'depotFile': '//p4_test/synced.txt', 'headRev': '2', 'headType': 'text', 'digest': 'ABC'}
+    assert key(record) == 'abc'
+    assert key(dict(record, headType='text+k')) != 'abc'
+    assert key(dict(record, digest=None), 'a:1666') != key(dict(record, digest=None), 'b:1666')
+    assert key({'depotFile': '//p4_test/synced.txt'}) is None
+
+
+def test_cache(tmpdir):
+    cache = RevisionCache(str(tmpdir), maxsize=250)
+    assert cache.open('aa') is None
+    assert 'aa' not in cache
+
+    cache.put('aa', io.BytesIO(b'a' * 100))
+    cache.put('bb', io.BytesIO(b'b' * 100))
+    cache.put('cc', io.BytesIO(b''))
+    assert cache.open('aa').read() == b'a' * 100
+    assert cache.map('bb')[:10] == b'b' * 10
+    assert cache.map('cc') == b''
+    assert cache.size == 200
+
+    # -- The least recently used entry goes first
+    past = time.time() - 60
+    os.utime(cache.path('bb'), (past, past))
+    cache.put('dd', io.BytesIO(b'd' * 100))
+    assert 'bb' not in cache
+    assert 'aa' in cache and 'dd' in cache
+    assert cache.size <= 200
+
+
+def test_revision_cache(tmpdir):
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER, cache=str(tmpdir))
+    r = c.ls('//p4_test/synced.txt')[0]
+    data = r.open().read()
+    assert r._cacheKey in c.cache
+    assert r.open().read() == data
+    assert b''.join(r.contents(chunksize=4)) == data
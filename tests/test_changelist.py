@@ -157,3 +157,126 @@ def test_iadd():
     cl += files
     assert len(cl) == 2
     cl.delete()
+
+
+def test_pending_index():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    cl = c.findChangelist('indexed')
+    assert int(cl) in c._pending
+    assert c.findChangelist('  indexed\n') == cl
+
+    cl.description = 'indexed again'
+    cl.save()
+    assert c._pending.find('indexed again') == int(cl)
+
+    # -- A failed submit leaves the changelist pending and indexed
+    with pytest.raises(errors.CommandError):
+        cl.submit()
+    assert c.findChangelist('indexed again') == cl
+
+    cl.delete()
+    assert int(cl) not in c._pending
+
+
+def test_submitted_files():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    cl = Changelist(26, c)
+    assert cl.status == 'submitted'
+    assert len(cl) == 1
+    assert cl[0].depotFile == '//p4_test/edit.txt'
+    assert cl[-1].depotFile == '//p4_test/edit.txt'
+    assert [f.depotFile for f in cl] == ['//p4_test/edit.txt']
+
+
+def test_iter_changes():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    expected = [int(cl['change']) for cl in c.run(['changes', '-s', 'submitted', '//p4_test/...'])]
+    changes = list(c.iterChanges('//p4_test/...', status='submitted', pagesize=2))
+    assert [int(cl) for cl in changes] == expected
+    assert changes[0].status == 'submitted'
+    assert isinstance(changes[0].time, datetime.datetime)
+
+    changes = list(c.iterChanges('//p4_test/...', status='submitted', since=expected[-1], until=expected[0],
+                                 pagesize=1))
+    assert [int(cl) for cl in changes] == expected
+
+    # -- Pending changes are not matched by revision ranges, including empty ones
+    pending = c.findChangelist('iter_changes_pending')
+    try:
+        expected = [int(r['change']) for r in c.run(['changes', '-s', 'pending'])]
+        changes = list(c.iterChanges(status='pending', pagesize=1))
+        assert [int(cl) for cl in changes] == expected
+        assert int(pending) in expected
+
+        changes = list(c.iterChanges(status='pending', since=int(pending), until=int(pending), pagesize=1))
+        assert [int(cl) for cl in changes] == [int(pending)]
+    finally:
+        pending.delete()
+
+
+def test_changelists():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    changes = c.changelists([CL, 26])
+    assert [int(cl) for cl in changes] == [CL, 26]
+    assert changes[0].description == 'DO NOT COMMIT'
+    assert changes[0].status == 'pending'
+    assert changes[0].user == P4USER
+    assert len(changes[0]) == 2
+    assert changes[1].status == 'submitted'
+    assert changes[1].type == 'public'
+    assert changes[1].jobs == []
+    assert not hasattr(changes[1], 'typo')
+
+
+def test_shelve():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    cl = c.findChangelist('shelved')
+    cl += c.ls('//p4_test/s...', exclude_deleted=True)
+    cl.shelve()
+    with pytest.raises(errors.ShelveError):
+        Changelist(0, c).shelve()
+
+    try:
+        results = cl.unshelveInto([P4CLIENT, 'no_such_client'], force=True)
+        assert list(results) == [P4CLIENT, 'no_such_client']
+        assert len(results[P4CLIENT].records) == 2
+        assert not results[P4CLIENT].errors
+        assert results[P4CLIENT].seconds > 0
+        assert results['no_such_client'].errors
+        assert results['no_such_client'].records == []
+    finally:
+        c.run(['revert', '//p4_test/s...'])
+        c.run(['shelve', '-d', '-c', str(cl.change)])
+        cl.delete()
+
+
+class _CountingConnection(object):
+    """Streams numbered fstat records and counts how many are read"""
+    def __init__(self, count):
+        self.count = count
+        self.read = 0
+        self.queries = 0
+
+    def iterRun(self, cmd):
+        self.queries += 1
+        for i in range(self.count):
+            self.read += 1
+            yield {'code': 'stat', 'depotFile': '//p4_test/{:04}.txt'.format(i), 'headRev': '1'}
+
+
+def test_revision_sequence_pages():
+    from perforce.models import RevisionSequence
+
+    connection = _CountingConnection(95)
+    files = RevisionSequence(connection, ['fstat', '//p4_test/...'], pagesize=10)
+    assert files
+    assert [files[i].depotFile for i in range(95)] == ['//p4_test/{:04}.txt'.format(i) for i in range(95)]
+    assert connection.read == 95
+    assert connection.queries == 1
+
+    with pytest.raises(IndexError):
+        files[100]
+    assert connection.queries == 1
+
+    assert files[0].depotFile == '//p4_test/0000.txt'
+    assert connection.queries == 2
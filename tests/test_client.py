@@ -13,7 +13,7 @@ import datetime
 
 import pytest
 
-from perforce.models import Client, Connection, Stream
+from perforce.models import Client, Connection, ConnectionStatus, Stream
 from perforce import errors
 
 P4PORT = 'DESKTOP-M97HMBQ:1666'
@@ -98,3 +98,54 @@ def test_client_properties():
 #     assert s.view[0].depot == '//stream_test/main/...'
 #     assert s.view[0].client == '...'
 #     assert isinstance(s.access, datetime.datetime)
+
+
+def test_spec_cache():
+    con = Connection(port=P4PORT, user=P4USER)
+    c = Client(TEST_CLIENT, con)
+    assert ['client', '-o', TEST_CLIENT] in con.specs
+
+    c.description = 'cached'
+    assert Client(TEST_CLIENT, con).description != 'cached'
+    c.save()
+    assert ['client', '-o', TEST_CLIENT] not in con.specs
+    assert Client(TEST_CLIENT, con).description == 'cached'
+
+    # -- Specs submitted elsewhere are dropped by their spec depot path
+    con.invalidate(paths=['//spec/client/other.p4s'])
+    assert ['client', '-o', TEST_CLIENT] in con.specs
+    con.invalidate(changes=[1], paths=['//spec/client/{}.p4s'.format(TEST_CLIENT)])
+    assert ['client', '-o', TEST_CLIENT] not in con.specs
+
+    assert con.status == ConnectionStatus.OK
+    assert ['user', '-o', P4USER] in con.specs
+    con.invalidate(paths=['//spec/user/{}.p4s'.format(P4USER)])
+    assert ['user', '-o', P4USER] not in con.specs
+
+    con.specs.ttl = 0
+    con.specs.clear()
+    Client(TEST_CLIENT, con)
+    assert ['client', '-o', TEST_CLIENT] not in con.specs
+
+
+def test_stream_graph():
+    con = Connection(port=P4PORT, user=P4USER)
+    graph = con.streams()
+    main = graph['//stream_test/main']
+
+    # -- Every listed stream is loaded, stream -o is run once per name
+    listed = [r['Stream'] for r in con.run(['streams'])]
+    assert len(listed) > 1
+    assert len(graph) == len(listed)
+    assert all(name in graph for name in listed)
+
+    assert main in graph.roots
+    assert main.parent is None
+    assert main.type == 'mainline'
+    assert all(child.parent is main for child in main.children)
+    assert [s for s in graph] == list(graph.walk())
+
+    # -- Resolved locally to the same view the server reports
+    assert set(main.resolvedView) == set(Stream('//stream_test/main', con).view)
+    assert main.resolvedView is not main.resolvedView
+    assert con.streams()['//stream_test/main'].resolvedView == main.resolvedView
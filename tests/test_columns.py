@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_columns
+----------------------------------
+
+Tests for `perforce.columns` module.
+"""
+
+import pytest
+
+from perforce import Connection
+from perforce.columns import Columns, StringColumn, DictionaryColumn
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+P4PORT = 'DESKTOP-M97HMBQ:1666'
+P4USER = 'p4test'
+P4CLIENT = 'p4_unit_tests'
+
+
+def test_columns():
+    table = Columns(['depotFile', 'headRev', 'headType', 'headTime'])
+    table.append({b'depotFile': b'//p4_test/a.txt', b'headRev': b'2', b'headType': b'text', b'headTime': b'10'})
+    table.append({b'depotFile': b'//p4_test/b.bin', b'headRev': b'1', b'headType': b'binary'})
+    table.append({b'depotFile': b'//p4_test/c.txt', b'headRev': b'5', b'headType': b'text', b'headTime': b'30'})
+
+    assert len(table) == 3
+    assert isinstance(table['depotFile'], StringColumn)
+    assert isinstance(table['headType'], DictionaryColumn)
+    assert list(table['depotFile']) == ['//p4_test/a.txt', '//p4_test/b.bin', '//p4_test/c.txt']
+    assert table['depotFile'][-1] == '//p4_test/c.txt'
+    assert sum(table['headRev']) == 8
+    assert list(table['headTime']) == [10, -1, 30]
+    assert table['headType'].categories == ['text', 'binary']
+    assert list(table['headType'].codes) == [0, 1, 0]
+    assert table['headType'].counts() == {'text': 2, 'binary': 1}
+    assert table.row(1) == {'depotFile': '//p4_test/b.bin', 'headRev': 1, 'headType': 'binary', 'headTime': -1}
+
+
+@pytest.mark.skipif(numpy is None, reason='requires numpy')
+def test_numpy():
+    table = Columns(['headRev', 'headTime', 'headType'])
+    table.append({b'headRev': b'2', b'headTime': b'10', b'headType': b'text'})
+    table.append({b'headRev': b'1', b'headType': b'binary'})
+
+    arrays = table.numpy()
+    assert arrays['headRev'].sum() == 3
+    assert numpy.isnat(arrays['headTime'][1])
+    assert list(arrays['headType']) == [0, 1]
+
+
+def test_ls_columns():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    table = c.lsColumns('//p4_test/...', ['depotFile', 'headRev', 'headType', 'fileSize'])
+    revisions = c.ls('//p4_test/...')
+    assert sorted(table['depotFile']) == sorted(r.depotFile for r in revisions)
+    assert sum(table['headRev']) == sum(r.head.revision for r in revisions)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_crawl
+----------------------------------
+
+Tests for `perforce.crawl` module.
+"""
+
+import os
+
+from perforce import Connection
+from perforce.crawl import Crawler
+
+P4PORT = 'DESKTOP-M97HMBQ:1666'
+P4USER = 'p4test'
+P4CLIENT = 'p4_unit_tests'
+
+
+def test_crawl():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    expected = sorted(r.depotFile for r in c.ls('//p4_test/...'))
+
+    crawler = Crawler('//p4_test', c, shardsize=2, workers=3)
+    records = [r['depotFile'] for r in crawler]
+    assert sorted(records) == expected
+    assert records == [r['depotFile'] for r in Crawler('//p4_test', c, shardsize=2, workers=1)]
+
+
+def test_resume(tmpdir):
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    checkpoint = str(tmpdir.join('crawl.json'))
+
+    crawler = Crawler('//p4_test', c, command='files', shardsize=1, checkpoint=checkpoint)
+    assert len(crawler.shards) > 1
+    seen = []
+    for index, records in crawler.iterShards():
+        seen += [r['depotFile'] for r in records]
+        break
+    assert os.path.exists(checkpoint)
+
+    resumed = Crawler('//p4_test', c, command='files', shardsize=1, checkpoint=checkpoint)
+    assert resumed.done == 0
+    seen += [r['depotFile'] for r in resumed]
+    # -- The interrupted shard is listed again
+    assert set(seen) == set(r['depotFile'] for r in c.run(['files', '//p4_test/...']))
+    assert not os.path.exists(checkpoint)
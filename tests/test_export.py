@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_export
+----------------------------------
+
+Tests for `perforce.export` module.
+"""
+
+import io
+import tempfile
+
+import path
+
+from perforce import Connection
+from perforce.export import Exporter, Segment
+
+P4PORT = 'DESKTOP-M97HMBQ:1666'
+P4USER = 'p4test'
+P4CLIENT = 'p4_unit_tests'
+FILE = '//p4_test/synced.txt'
+
+
+def test_segment():
+    fh = io.BytesIO(b'0123456789')
+    segment = Segment(fh, 3, 4)
+    assert segment.read(3) == b'345'
+    assert segment.read() == b'6'
+    assert segment.read() == b''
+
+
+def test_export():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    dest = path.Path(tempfile.mkdtemp())
+    result = c.export('//p4_test/...', dest / 'tree', workers=2, batchsize=2)
+    assert result.files == len(c.ls('//p4_test/...', exclude_deleted=True))
+    assert (dest / 'tree' / 'synced.txt').bytes() == c.ls(FILE)[0].open().read()
+
+    c.export('//p4_test/...', dest / 'a.tar.gz', workers=1)
+    Exporter('//p4_test/...', dest / 'b.tar.gz', c, workers=3, batchsize=1).run()
+    assert (dest / 'a.tar.gz').bytes() == (dest / 'b.tar.gz').bytes()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_feed
+----------------------------------
+
+Tests for `perforce.feed` module.
+"""
+
+from perforce import Connection
+from perforce.feed import ChangeFeed
+
+P4PORT = 'DESKTOP-M97HMBQ:1666'
+P4USER = 'p4test'
+P4CLIENT = 'p4_unit_tests'
+
+
+def test_feed(tmpdir):
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    state = str(tmpdir.join('feed.json'))
+    latest = int(c.run(['changes', '-s', 'submitted', '-m', '1'])[0]['change'])
+    assert ChangeFeed(c).mark == latest
+    assert ChangeFeed(c).poll() == []
+
+    delivered = []
+    feed = ChangeFeed(c, since=latest - 2, state=state)
+    feed.subscribe(lambda change, paths: delivered.append((change.change, paths)))
+    changes = feed.poll()
+
+    assert [cl.change for cl in changes] == [n for n, _ in delivered]
+    assert delivered[-1][0] == latest
+    assert all(paths for _, paths in delivered)
+    assert feed.mark == latest
+    assert ChangeFeed(c, state=state).mark == latest
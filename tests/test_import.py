@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_import
+----------------------------------
+
+Tests and benchmark for the import time of `perforce`, run this file directly to print the timings.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import compileall
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIMER = 'import timeit; t = timeit.default_timer(); {}; print(timeit.default_timer() - t)'
+STATEMENTS = ('import perforce', 'from perforce import Connection')
+
+
+def python(code, path=ROOT, **env):
+    """Runs code in a new interpreter importing perforce from path and returns the last line it printed"""
+    environ = dict(os.environ, PYTHONPATH=path, **env)
+    output = subprocess.check_output([sys.executable, '-c', code], env=environ, cwd=path)
+
+    return output.decode('utf8').strip().splitlines()[-1]
+
+
+def benchmark(runs=10):
+    """Times each statement in new interpreters on a copy of the package, cold when every module is compiled from
+    source and warm when the bytecode is already compiled
+
+    :param runs: Number of interpreters to time for each
+    :type runs: int
+    :returns: dict of (statement, 'cold' or 'warm') to median seconds
+    """
+    root = tempfile.mkdtemp()
+    try:
+        shutil.copytree(os.path.join(ROOT, 'perforce'), os.path.join(root, 'perforce'),
+                        ignore=shutil.ignore_patterns('__pycache__', '*.pyc'))
+
+        timings = {}
+        for statement in STATEMENTS:
+            code = TIMER.format(statement)
+            cold = [float(python(code, root, PYTHONDONTWRITEBYTECODE='1')) for _ in range(runs)]
+            timings[(statement, 'cold')] = sorted(cold)[runs // 2]
+
+        compileall.compile_dir(os.path.join(root, 'perforce'), quiet=1)
+        for statement in STATEMENTS:
+            code = TIMER.format(statement)
+            warm = [float(python(code, root)) for _ in range(runs)]
+            timings[(statement, 'warm')] = sorted(warm)[runs // 2]
+    finally:
+        shutil.rmtree(root)
+
+    return timings
+
+
+def test_lazy_import():
+    assert python('import sys, perforce; print(sorted(set(sys.modules) & {"perforce.models", "path"}))') == '[]'
+    assert python('import sys, perforce; perforce.Connection; print("perforce.models" in sys.modules)') == 'True'
+    assert python('from perforce import connect, ErrorLevel; print(ErrorLevel.FAILED)') == '3'
+    assert python('import perforce; print("Stream" in dir(perforce))') == 'True'
+
+
+def test_benchmark():
+    timings = benchmark(runs=1)
+    assert sorted(timings) == sorted((s, t) for s in STATEMENTS for t in ('cold', 'warm'))
+    assert all(seconds > 0 for seconds in timings.values())
+
+
+if __name__ == '__main__':
+    for (statement, kind), seconds in sorted(benchmark().items()):
+        print('{:<35} {:<5} {:8.2f} ms'.format(statement, kind, seconds * 1000))
@@ -10,6 +10,7 @@ Tests for `python-perforce` module.
 
 import os
 import unittest
+import tempfile
 import datetime
 
 import pytest
@@ -19,6 +20,7 @@ import six
 from perforce import connect, Connection, Revision, ConnectionStatus, ErrorLevel
 from perforce import errors
 from perforce import api
+from perforce import models
 
 FILE = path.Path('//p4_test/synced.txt')
 CLIENT_FILE = path.Path(r"E:\Users\brett\Perforce\p4_unit_tests\p4_test\synced.txt")
@@ -129,6 +131,28 @@ class RevisionTests(unittest.TestCase):
         self.assertFalse(r.clientFile.exists())
         r.revert()
 
+    def test_digests(self):
+        revs = self._conn.ls([FILE, TO_EDIT])
+        self.assertTrue(all('digest' not in r._p4dict for r in revs))
+        self._conn.fillDigests(revs)
+        self.assertEqual('BEB6A43ADFB950EC6F82CEED19BEEE21', revs[1].hash)
+        self.assertEqual(10, len(revs[1]))
+        self.assertEqual('edit', revs[1].action)
+
+        revs = self._conn.ls([FILE, TO_EDIT], digests=True)
+        self.assertEqual('BEB6A43ADFB950EC6F82CEED19BEEE21', revs[1]._p4dict['digest'])
+
+    def test_contents(self):
+        r = self._conn.ls(FILE)[0]
+        with r.open() as fh:
+            data = fh.read()
+        self.assertEqual(6, len(data))
+        self.assertEqual(data, b''.join(r.contents(chunksize=4)))
+
+        dest = path.Path(tempfile.mkdtemp()) / 'synced.txt'
+        self.assertEqual(dest, r.export(dest))
+        self.assertEqual(data, dest.bytes())
+
     def test_head(self):
         r = self._conn.ls(TO_EDIT)[0]
 
@@ -155,6 +179,16 @@ def test_not_added():
     res = c.canAdd('foo.txt')
     assert res == False
 
+
+def test_can_add_many():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    res = c.canAdd([NOT_ADDED, NOT_ADDED_EMPTY, FILE, 'foo.txt'])
+    assert res == {NOT_ADDED: True, NOT_ADDED_EMPTY: True, FILE: False, 'foo.txt': False}
+
+    assert c.client.inView(NOT_ADDED)
+    assert not c.client.inView('//not_mapped/foo.txt')
+
+
 def test_open():
     c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
     rev = c.ls(NOT_ADDED)
@@ -181,6 +215,49 @@ def test_open():
     rev[0].revert()
 
 
+def test_open_many():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    revs = api.open([NOT_ADDED, CLIENT_FILE, 'foo.txt'], c)
+    assert sorted(r.action for r in revs) == ['add', 'edit']
+
+    for rev in revs:
+        rev.revert()
+
+    revs = api.edit([CLIENT_FILE, NOT_ADDED], c)
+    assert [r.action for r in revs] == ['edit']
+    revs[0].revert()
+
+    revs = api.sync([FILE, TO_EDIT], c)
+    assert len(revs) == 2
+    assert all(r.isSynced for r in revs)
+
+
+def test_open_into_empty_changelist():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    cl = c.findChangelist('open into empty')
+    assert cl
+    try:
+        revs = api.edit([CLIENT_FILE], c, changelist=cl)
+        assert [r.changelist.change for r in revs] == [cl.change]
+        assert len(cl) == 1
+    finally:
+        cl.delete()
+
+
+def test_delete_many():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    cl = c.findChangelist('delete many')
+    try:
+        revs = api.delete([FILE, TO_EDIT, NOT_ADDED], c, changelist=cl)
+        assert sorted(r.depotFile for r in revs) == sorted([FILE, TO_EDIT])
+        assert all(r.action == 'delete' for r in revs)
+        assert len(cl) == 2
+    finally:
+        for rev in cl:
+            rev.revert()
+        cl.delete()
+
+
 def test_bad_info():
     c = Connection(port=P4PORT, client='bad_client', user=P4USER)
     c.run(['info'])
@@ -212,3 +289,77 @@ def test_moved():
 def test_too_many_files():
     c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
     assert c.ls(['0'*1001, '0'*1001, '0'*1001, '0'*1001, '0'*1001, '0'*1001, '0'*1001, '0'*1001, ]) == []
+
+
+def test_partial():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER, level=ErrorLevel.WARN)
+    with pytest.raises(errors.CommandError):
+        c.runArgs(['fstat'], [FILE, '//p4_test/missing.txt', TO_EDIT])
+
+    result = c.runArgs(['fstat'], [FILE, '//p4_test/missing.txt', TO_EDIT], partial=True)
+    assert [r['depotFile'] for r in result.records] == [FILE, TO_EDIT]
+    assert len(result.errors) == 1
+    assert 'missing.txt' in result.errors[0]['data']
+    assert [r.depotFile for r in c.ls([FILE, '//p4_test/missing.txt'])] == [FILE]
+
+    # -- Errors that are not about a file still raise
+    c = Connection(port='foo', client='bar', user='baz')
+    with pytest.raises(errors.CommandError):
+        c.runArgs(['fstat'], [FILE, TO_EDIT], partial=True)
+
+
+def test_system_error():
+    assert models.system_error({b'code': b'error', b'severity': ErrorLevel.FATAL, b'data': b'Bad'})
+    assert models.system_error({b'code': b'error', b'severity': 3, b'generic': 37, b'data': b'Network error'})
+    assert models.system_error({b'code': b'error', b'severity': 3,
+                                b'data': b'Your session has expired, please login again.'})
+    assert not models.system_error({b'code': b'error', b'severity': 3, b'generic': 17,
+                                    b'data': b'//p4_test/missing.txt - no such file(s).'})
+
+
+def test_change_args():
+    assert models.change_args(None) == []
+    assert models.change_args(0) == ['-c', 'default']
+    assert models.change_args('12') == ['-c', '12']
+
+
+def test_monitor():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    changes = []
+    monitor = c.monitor(interval=1, callback=lambda old, new: changes.append((old, new)))
+    try:
+        assert monitor.poll() == ConnectionStatus.OK
+        assert c.status == ConnectionStatus.OK
+        assert (None, ConnectionStatus.OK) in changes
+        assert monitor.latency
+        assert c.monitor() is monitor
+    finally:
+        monitor.stop()
+    assert not monitor.running
+
+    # -- A stopped monitor no longer answers for the connection
+    monitor._status = ConnectionStatus.NO_AUTH
+    assert c.status == ConnectionStatus.OK
+
+    c = Connection(port='foo', client='bar', user='baz')
+    assert c.monitor(timeout=1).poll() == ConnectionStatus.OFFLINE
+    c.monitor().stop()
+
+
+def test_fields():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    revs = c.ls([FILE, TO_EDIT], fields=['headType'])
+    assert 'headType' in revs[0].fields
+    assert 'headTime' not in revs[0].fields
+    assert revs[0].head.type == 'text'
+
+    # -- Missing fields are loaded for every revision of the call at once
+    assert revs[1].head.action == 'edit'
+    assert 'headTime' in revs[0].fields
+    assert revs[0].head.revision == c.ls(FILE)[0].head.revision
+
+    # -- Membership tests load the fields outside of the projection
+    revs = c.ls([FILE, TO_EDIT], fields=['depotFile'])
+    assert revs[0].isMapped
+    assert revs[1].isMapped
+    assert 'headTime' in revs[1].fields
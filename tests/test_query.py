@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_query
+----------------------------------
+
+Tests for `perforce.query` module.
+"""
+
+import pytest
+
+from perforce import Connection
+from perforce.query import Q, escape
+
+P4PORT = 'DESKTOP-M97HMBQ:1666'
+P4USER = 'p4test'
+P4CLIENT = 'p4_unit_tests'
+
+
+def test_compile():
+    q = Q(headType__contains='binary') & Q(headChange__gt=1000)
+    assert q.compile() == ([], 'headType=*binary* & headChange>1000')
+    assert q.limit(10).compile() == (['-m', '10'], 'headType=*binary* & headChange>1000')
+
+    q = Q(opened=True) & Q(change=12) & (Q(headType='text') | Q(headAction__in=['add', 'edit']))
+    assert q.compile() == (['-Ro', '-e', '12'], '(headType=text | (headAction=add | headAction=edit))')
+
+    assert Q(headAction__ne='delete').compile() == ([], '^headAction=delete')
+    assert Q(digest__exists=False).compile() == ([], '^digest=*')
+    assert (~Q(headRev__gte=3)).compile() == ([], 'headRev<3')
+    assert (~(Q(headRev=1) | Q(headRev=2))).compile() == ([], '^headRev=1 & ^headRev=2')
+    assert (Q(opened=True) | Q(have=True)).compile() == ([], 'action=* | haveRev=*')
+
+
+def test_escape():
+    assert escape('a b(c)|d') == 'a\\ b\\(c\\)\\|d'
+    assert Q(depotFile__startswith='//p4 test/').compile()[1] == 'depotFile=//p4\\ test/*'
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        Q(**{'head Type': 'text'})
+    with pytest.raises(ValueError):
+        Q(headRev__between=1)
+    with pytest.raises(ValueError):
+        (Q(mapped=True) | Q(headRev=1)).compile()
+
+
+def test_ls_query():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    revisions = c.ls('//p4_test/...', query=Q(headAction='edit'))
+    assert revisions
+    assert all(r.head.action == 'edit' for r in revisions)
+    assert len(c.ls('//p4_test/...', query=Q().limit(1))) == 1
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_results
+----------------------------------
+
+Tests for `perforce.results` module.
+"""
+
+import pytest
+
+from perforce import Connection
+from perforce import results
+from perforce.results import ResultSet
+
+P4PORT = 'DESKTOP-M97HMBQ:1666'
+P4USER = 'p4test'
+P4CLIENT = 'p4_unit_tests'
+
+
+def test_result_set(monkeypatch):
+    monkeypatch.setattr(results, 'READ_SIZE', 100)
+    records = [{'depotFile': '//p4_test/{}.txt'.format(i), 'headRev': str(i)} for i in range(50)]
+    rs = ResultSet(records, budget=200)
+
+    assert rs.spilled
+    assert len(rs) == 50
+    assert list(rs) == records
+    assert list(rs) == records
+    assert rs[0] == records[0]
+    assert rs[30] == records[30]
+    assert rs[-1] == records[-1]
+    assert rs[45:48] == records[45:48]
+    with pytest.raises(IndexError):
+        rs[50]
+
+    rs.append({'depotFile': '//p4_test/last.txt'})
+    assert rs[-1]['depotFile'] == '//p4_test/last.txt'
+
+    rs.close()
+    assert rs.closed
+    assert not rs.spilled
+    for use in (len, list, lambda r: r[0], lambda r: r.append({})):
+        with pytest.raises(ValueError):
+            use(rs)
+
+
+def test_in_memory():
+    with ResultSet([{'a': '1'}, {'a': '2'}]) as rs:
+        assert not rs.spilled
+        assert [r['a'] for r in rs] == ['1', '2']
+    assert rs.closed
+    assert not ResultSet()
+
+
+def test_run_budget():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    expected = c.run(['fstat', '//p4_test/...'])
+    records = c.run(['fstat', '//p4_test/...'], budget=0)
+    assert isinstance(records, ResultSet)
+    assert records.spilled
+    assert list(records) == expected
+
+    result = c.runArgs(['fstat'], ['//p4_test/...', '//p4_test/missing.txt'], partial=True, budget=0)
+    assert list(result.records) == expected
+    assert len(result.errors) == 1
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_workspace
+----------------------------------
+
+Tests for `perforce.workspace` module.
+"""
+
+import sys
+import time
+import hashlib
+
+import pytest
+
+from perforce import Connection
+from perforce.workspace import digest, verify, reconcile, Tracker
+
+P4PORT = 'DESKTOP-M97HMBQ:1666'
+P4USER = 'p4test'
+P4CLIENT = 'p4_unit_tests'
+
+
+def test_digest(tmpdir):
+    f = tmpdir.join('file.txt')
+    f.write_binary(b'foo\r\nbar\r\n' * 100)
+
+    assert digest(str(f)) == hashlib.md5(b'foo\r\nbar\r\n' * 100).hexdigest().upper()
+    assert digest(str(f), crlf=True, blocksize=7) == hashlib.md5(b'foo\nbar\n' * 100).hexdigest().upper()
+
+
+def test_verify():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    result = verify('//p4_test/...', c)
+    assert '//p4_test/synced.txt' in [r.depotFile for r in result.matched]
+    assert not result.mismatched
+    assert '//p4_test/edit.txt' in [r.depotFile for r in result.skipped]
+
+    revs = c.ls('//p4_test/synced.txt')
+    assert verify(revs, c).matched == revs
+
+
+def test_reconcile():
+    c = Connection(port=P4PORT, client=P4CLIENT, user=P4USER)
+    rev = c.ls('//p4_test/synced.txt')[0]
+    result = reconcile(connection=c, dryrun=True)
+    assert rev.clientFile not in result.edit
+    assert rev.clientFile not in result.delete
+    assert c.ls('//p4_test/not_added.txt') == []
+    assert any(f.endswith('not_added.txt') for f in result.add)
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is only available on Linux')
+def test_tracker(tmpdir):
+    tmpdir.mkdir('sub')
+    with Tracker(str(tmpdir)) as tracker:
+        tmpdir.join('sub', 'foo.txt').write('foo')
+        tmpdir.mkdir('new').join('bar.txt').write('bar')
+        time.sleep(1)
+        assert str(tmpdir.join('sub', 'foo.txt')) in tracker.touched
+        assert str(tmpdir.join('new')) in tracker._rescan
+
+        tracker.reset()
+        assert tracker.touched == set()
+
+
+def test_tracker_platform(tmpdir, monkeypatch):
+    monkeypatch.setattr(sys, 'platform', 'win32')
+    with pytest.raises(OSError):
+        Tracker(str(tmpdir))